@@ -1,65 +1,80 @@
 import os
-import re
+import json
+from functools import lru_cache
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
-from langchain_experimental.sql import SQLDatabaseSequentialChain
 
-
-# -----------------------------------------------------
-# 🧩 Custom Safe SQLDatabase — cleans GPT output before execution
-# -----------------------------------------------------
-class SafeSQLDatabase(SQLDatabase):
-    def run(self, command: str, fetch: str = "all", **kwargs):
-        """
-        Cleans GPT-generated SQL before sending it to Postgres.
-        Prevents syntax errors from ```sql or other non-SQL text.
-        """
-        # Remove Markdown code fences like ```sql or ```
-        clean_sql = re.sub(r"```sql|```", "", command, flags=re.IGNORECASE).strip()
-        # Remove excessive whitespace/newlines
-        clean_sql = re.sub(r"\s+", " ", clean_sql)
-        return super().run(clean_sql, fetch=fetch, **kwargs)
+# 10-day progress aggregate — one fixed statement text with a bound student_id,
+# so Postgres/PgBouncer can reuse the plan (served by idx_spp_student_progress)
+PROGRESS_SQL = text(
+    "SELECT"
+    " COUNT(*) FILTER (WHERE phase_type = 'concept') AS concepts_completed,"
+    " COUNT(*) FILTER (WHERE phase_type = 'mcq') AS mcqs_completed"
+    " FROM student_phase_pointer"
+    " WHERE student_id = :sid AND is_completed = true"
+    " AND end_time > NOW() - INTERVAL '10 days'"
+)
 
 
 # -----------------------------------------------------
-# 🚀 Database + Model Setup
+# 🚀 Database + Model Setup (lazy, one instance per process)
 # -----------------------------------------------------
 DB_URL = os.getenv("DATABASE_URL")  # Supabase/Postgres connection string
-db = SafeSQLDatabase.from_uri(DB_URL)
 
-# Use GPT-4-Turbo for SQL reasoning and narrative commentary
-llm = ChatOpenAI(model="gpt-4-turbo", temperature=0)
 
-# Create the SQL + reasoning chain
-analytics_chain = SQLDatabaseSequentialChain.from_llm(
-    llm=llm,
-    db=db,
-    verbose=True
-)
+@lru_cache(maxsize=1)
+def get_engine() -> Engine:
+    # One pooled SQLAlchemy engine per process; the SQL here is fixed, no LLM writes it
+    return create_engine(DB_URL)
+
+
+@lru_cache(maxsize=1)
+def get_feedback_llm() -> ChatOpenAI:
+    # Small model for single-shot mentor commentary over pre-computed stats
+    return ChatOpenAI(model="gpt-4o-mini", temperature=0.7, max_tokens=200)
+
+FEEDBACK_SYSTEM_PROMPT = """You are an experienced NEET-PG mentor reviewing a student's last 10 days of preparation.
+Write a short mentor-style feedback paragraph that:
+  - Highlights their pace, focus, and consistency.
+  - Points out one area of improvement.
+  - Sounds encouraging yet critically constructive.
+Reply with the paragraph only — plain prose, no JSON, no headings."""
 
 
 # -----------------------------------------------------
 # 🧩 Wrapper Function — Safe Execution
 # -----------------------------------------------------
-def safe_run_chain(prompt: str):
+def fetch_recent_progress(student_id: str) -> dict:
     """
-    Safely executes the analytics chain:
-    - Cleans invalid SQL before it reaches the DB.
-    - Uses .invoke() (modern LangChain API).
-    - Returns a clean, readable string result.
+    Counts concepts and MCQs the student completed in the last 10 days.
+    Runs the aggregate directly (no LLM-generated SQL).
     """
-    try:
-        raw_result = analytics_chain.invoke(prompt)
+    with get_engine().connect() as conn:
+        row = conn.execute(PROGRESS_SQL, {"sid": student_id}).mappings().one()
+    return {
+        "concepts_completed": int(row["concepts_completed"] or 0),
+        "mcqs_completed": int(row["mcqs_completed"] or 0),
+    }
 
-        # Extract result text from dict if present
-        if isinstance(raw_result, dict) and "result" in raw_result:
-            result_text = raw_result["result"]
-        else:
-            result_text = str(raw_result)
 
-        # Remove any stray triple backticks or code fences
-        clean_result = re.sub(r"```.*?```", "", result_text, flags=re.DOTALL).strip()
-        return clean_result
+def generate_progress_feedback(student_id: str) -> str:
+    """
+    Direct SQL + one LLM call for the commentary → mentor feedback JSON string.
+    The counts come from SQL, never from the model.
+    Returns "Error: ..." on failure.
+    """
+    try:
+        progress = fetch_recent_progress(student_id)
+        reply = get_feedback_llm().invoke([
+            ("system", FEEDBACK_SYSTEM_PROMPT),
+            ("user", json.dumps(progress)),
+        ])
+        return json.dumps({
+            "student_id": student_id,
+            **progress,
+            "mentor_commentary": reply.content.strip(),
+        })
 
     except Exception as e:
         return f"Error: {str(e)}"
@@ -1,14 +1,44 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import os, asyncio, logging, requests, time, jwt, json
+import os, asyncio, logging, httpx, time, jwt, orjson, socket, base64, hmac, hashlib
+import redis.asyncio as redis
+from log_utils import setup_queue_logging
 
 # -----------------------------------------------------
 # 🔧 Setup
 # -----------------------------------------------------
 load_dotenv()
-app = FastAPI(title="Battle API")
+
+# 🌐 Shared async HTTP client for Realtime broadcasts (pooled, keep-alive, HTTP/2)
+_http = httpx.AsyncClient(
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=500, max_keepalive_connections=200, keepalive_expiry=60
+        ),
+        retries=2,  # connect-level retries only
+    ),
+    timeout=5.0,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🔥 Open the TCP/TLS connection to Supabase before the first broadcast needs it
+    try:
+        await _http.head(os.getenv("SUPABASE_URL"))
+    except Exception as e:
+        logger.warning("⚠️ Realtime connection pre-warm failed: %s", e)
+    yield
+    await _http.aclose()
+    if _redis is not None:
+        await _redis.aclose()
+
+
+app = FastAPI(title="Battle API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,11 +48,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    datefmt="%H:%M:%S",
-)
+setup_queue_logging(default_level="INFO")
 logger = logging.getLogger("battle_api")
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -30,62 +56,142 @@ SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")  # ✅ NEW — from “Legacy JWT Secret”
 
+SUPABASE_PROJECT_REF = None
+
 # 🔍 Sanity check
 if not SUPABASE_SERVICE_KEY:
     logger.error("🚨 SUPABASE_SERVICE_ROLE_KEY not found in environment!")
 else:
-    logger.info(f"🔑 Loaded Supabase key length: {len(SUPABASE_SERVICE_KEY)}")
+    logger.info("🔑 Loaded Supabase key length: %s", len(SUPABASE_SERVICE_KEY))
     try:
         decoded = jwt.decode(SUPABASE_SERVICE_KEY, options={"verify_signature": False})
-        logger.info(f"🧩 Key decoded → role={decoded.get('role')}, ref={decoded.get('ref')}")
+        SUPABASE_PROJECT_REF = decoded.get("ref")
+        logger.info("🧩 Key decoded → role=%s, ref=%s", decoded.get('role'), decoded.get('ref'))
     except Exception as e:
-        logger.error(f"❌ Failed to decode Supabase key: {e}")
+        logger.exception("❌ Failed to decode Supabase key: %s", e)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-active_battles = set()
+
+# -----------------------------------------------------
+# 🔒 Orchestrator lease — one run_battle_sequence per battle across workers
+# -----------------------------------------------------
+REDIS_URL = os.getenv("REDIS_URL")
+ORCHESTRATOR_LEASE_TTL = 3600  # seconds; renewed on every question tick
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_redis = redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+active_battles = set()  # fallback when REDIS_URL is not configured (single worker)
+
+# Owner-checked lease ops: the GET and the DEL / EXPIRE run as one step in
+# Redis, so a lease that expired and was re-claimed by another worker in
+# between is never deleted or extended by the old owner
+_release_lease = _redis.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+) if _redis is not None else None
+_renew_lease = _redis.register_script(
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+) if _redis is not None else None
+
+
+def _lease_key(battle_id: str) -> str:
+    return f"battle:{battle_id}:orch"
+
+
+async def claim_battle(battle_id: str) -> bool:
+    """Atomically claim the orchestrator for a battle. False if another worker holds it."""
+    if _redis is None:
+        if battle_id in active_battles:
+            return False
+        active_battles.add(battle_id)
+        return True
+    return bool(await _redis.set(_lease_key(battle_id), WORKER_ID, nx=True, ex=ORCHESTRATOR_LEASE_TTL))
+
+
+async def release_battle(battle_id: str):
+    """Release the lease if this worker still owns it."""
+    if _redis is None:
+        active_battles.discard(battle_id)
+        return
+    try:
+        await _release_lease(keys=[_lease_key(battle_id)], args=[WORKER_ID])
+    except Exception as e:
+        logger.exception("💥 Failed to release orchestrator lease for %s: %s", battle_id, e)
+
+
+async def renew_battle(battle_id: str) -> bool:
+    """Extend the lease by ORCHESTRATOR_LEASE_TTL. False only if another worker now owns it."""
+    if _redis is None:
+        return True
+    try:
+        return bool(await _renew_lease(keys=[_lease_key(battle_id)], args=[WORKER_ID, ORCHESTRATOR_LEASE_TTL]))
+    except Exception as e:
+        # Redis hiccup: keep running on the current lease, retry next tick
+        logger.warning("⚠️ Failed to renew orchestrator lease for %s: %s", battle_id, e)
+        return True
+
+# 🔐 Signed Realtime JWT reused across broadcasts until it nears expiry
+REALTIME_JWT_TTL = 300
+_jwt_cache = {"token": None, "exp": 0}
+
+# Fixed-shape HS256 signer — header and key encoded once
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+_JWT_SECRET_BYTES = SUPABASE_JWT_SECRET.encode() if SUPABASE_JWT_SECRET else None
+
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _sign_hs256(payload: dict) -> str:
+    if _JWT_SECRET_BYTES is None:
+        raise ValueError("SUPABASE_JWT_SECRET is not set")
+    signing_input = _JWT_HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
+    signature = hmac.new(_JWT_SECRET_BYTES, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url(signature)).decode()
 
 # -----------------------------------------------------
 # 🔹 Helper: Generate Realtime JWT (aud = realtime)
 # -----------------------------------------------------
 def get_realtime_jwt():
-    """Generate short-lived JWT accepted by Supabase Realtime REST API."""
+    """Return a short-lived JWT accepted by Supabase Realtime REST API (cached, refreshed <10s before expiry)."""
+    if _jwt_cache["token"] and time.time() < _jwt_cache["exp"] - 10:
+        return _jwt_cache["token"]
+
     try:
-        decoded = jwt.decode(SUPABASE_SERVICE_KEY, options={"verify_signature": False})
-        project_ref = decoded.get("ref")
+        exp = int(time.time()) + REALTIME_JWT_TTL
         payload = {
             "aud": "realtime",
             "role": "service_role",
-            "iss": f"https://{project_ref}.supabase.co",
-            "exp": int(time.time()) + 60,  # valid 60s
+            "iss": f"https://{SUPABASE_PROJECT_REF}.supabase.co",
+            "exp": exp,
         }
 
-        # ⚙️ TEMPORARY DEBUG LOGS
-        signing_key = SUPABASE_JWT_SECRET  # or change manually to SUPABASE_JWT_SECRET when testing
-        token = jwt.encode(payload, signing_key, algorithm="HS256")
-
-        logger.info("🔐 Generated Realtime JWT payload:")
-        logger.info(json.dumps(payload, indent=2))
-        logger.info(f"🔏 Using key: {'SERVICE_ROLE_KEY' if signing_key == SUPABASE_SERVICE_KEY else 'JWT_SECRET'}")
-        logger.info(f"🔑 JWT sample (first 80 chars): {token[:80]}...")
-
-        try:
-            # 🔧 CHANGE: Ignore audience validation (to avoid harmless warning)
-            decoded_check = jwt.decode(
-                token, signing_key, algorithms=["HS256"], options={"verify_aud": False}
-            )
-            logger.info(f"🧩 Local verify → OK, aud={decoded_check.get('aud')}")
-        except Exception as verify_err:
-            logger.error(f"❌ Local verification failed → {verify_err}")
-
+        token = _sign_hs256(payload)
+        logger.info("🔐 Generated Realtime JWT (valid %ss)", REALTIME_JWT_TTL)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s", orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
+            logger.debug("🔑 JWT sample (first 80 chars): %s...", token[:80])
+            try:
+                # 🔧 Ignore audience validation (to avoid harmless warning)
+                decoded_check = jwt.decode(
+                    token, SUPABASE_JWT_SECRET, algorithms=["HS256"], options={"verify_aud": False}
+                )
+                logger.debug("🧩 Local verify → OK, aud=%s", decoded_check.get("aud"))
+            except Exception as verify_err:
+                logger.exception("❌ Local verification failed → %s", verify_err)
+
+        _jwt_cache["token"] = token
+        _jwt_cache["exp"] = exp
         return token
     except Exception as e:
-        logger.error(f"❌ Failed to create realtime JWT: {e}")
+        logger.exception("❌ Failed to create realtime JWT: %s", e)
         return SUPABASE_SERVICE_KEY
 
 # -----------------------------------------------------
 # 🔹 Broadcast Helper (✅ Realtime v2 REST schema)
 # -----------------------------------------------------
-def broadcast_event(battle_id: str, event: str, payload: dict):
+async def broadcast_event(battle_id: str, event: str, payload: dict):
     """Send broadcast event to Supabase Realtime channel (v2 format, normalized)."""
     try:
         # ✅ NORMALIZED BODY STRUCTURE — matches client .on('broadcast')
@@ -106,17 +212,20 @@ def broadcast_event(battle_id: str, event: str, payload: dict):
         realtime_url = f"{SUPABASE_URL}/realtime/v1/api/broadcast"
         realtime_jwt = get_realtime_jwt()  # ✅ Use correct JWT
 
-        logger.info(f"🌍 Realtime URL = {realtime_url}")
-        logger.info(f"📡 Broadcasting {event} → battle:{battle_id}")
-        logger.info(f"🧠 Payload = {json.dumps(body, indent=2)}")
-        logger.info(f"🔧 Headers preview:")
-        logger.info(json.dumps({
-            "apikey": "SERVICE_ROLE_KEY...",
-            "Authorization": f"Bearer {realtime_jwt[:40]}...",
-            "Content-Type": "application/json"
-        }, indent=2))
-
-        res = requests.post(
+        content = orjson.dumps(body)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🌍 Realtime URL = %s", realtime_url)
+            logger.debug("📡 Broadcasting %s → battle:%s", event, battle_id)
+            logger.debug("🧠 Payload = %s", orjson.dumps(body, option=orjson.OPT_INDENT_2).decode())
+            logger.debug("🔧 Headers preview:")
+            logger.debug(orjson.dumps({
+                "apikey": "SERVICE_ROLE_KEY...",
+                "Authorization": f"Bearer {realtime_jwt[:40]}...",
+                "Content-Type": "application/json"
+            }, option=orjson.OPT_INDENT_2).decode())
+
+        res = await _http.post(
             realtime_url,
             headers={
                 "apikey": SUPABASE_SERVICE_KEY,
@@ -125,20 +234,18 @@ def broadcast_event(battle_id: str, event: str, payload: dict):
                 "x-project-ref": SUPABASE_URL.split("//")[1].split(".")[0],
                 "x-client-info": "supabase-py-broadcast",
             },
-            json=body,
-            timeout=5,
+            content=content,
         )
 
-        logger.info(f"📡 [{battle_id}] Broadcast → {event} (status={res.status_code})")
-        logger.warning(f"🧾 Response body: {res.text}")
+        logger.info("📡 [%s] Broadcast → %s (status=%s)", battle_id, event, res.status_code)
         if res.status_code != 200 and res.status_code != 202:
-            logger.warning(f"❌ Broadcast failed → {res.text}")
-        else:
-            logger.info(f"✅ Broadcast succeeded for {event}")
-        return res.ok
+            logger.warning("❌ Broadcast failed → %s", res.text)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🧾 Response body: %s", res.text)
+        return res.is_success
 
     except Exception as e:
-        logger.error(f"💥 Broadcast failed ({event}): {e}")
+        logger.exception("💥 Broadcast failed (%s): %s", event, e)
         return False
 
 # -----------------------------------------------------
@@ -154,28 +261,32 @@ async def root():
 # -----------------------------------------------------
 @app.post("/battle/get_stats")
 async def get_battle_stats(mcq_id: str):
-    logger.info(f"📊 get_battle_stats called with mcq_id={mcq_id}")
+    logger.info("📊 get_battle_stats called with mcq_id=%s", mcq_id)
     try:
-        resp = supabase.rpc("get_battle_stats", {"mcq_id_input": mcq_id}).execute()
-        logger.info(f"🧾 Supabase RPC get_battle_stats → data={resp.data}")
+        resp = await asyncio.to_thread(
+            supabase.rpc("get_battle_stats", {"mcq_id_input": mcq_id}).execute
+        )
+        logger.debug("🧾 Supabase RPC get_battle_stats → data=%s", resp.data)
         if not resp.data:
             raise HTTPException(status_code=404, detail="No stats found")
         return {"success": True, "data": resp.data}
     except Exception as e:
-        logger.error(f"💥 get_battle_stats failed: {e}")
+        logger.exception("💥 get_battle_stats failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/battle/leaderboard")
 async def get_leaderboard(battle_id: str):
-    logger.info(f"🏆 get_leaderboard called with battle_id={battle_id}")
+    logger.info("🏆 get_leaderboard called with battle_id=%s", battle_id)
     try:
-        resp = supabase.rpc("get_leader_board", {"battle_id_input": battle_id}).execute()
-        logger.info(f"🧾 Supabase RPC get_leader_board → data={resp.data}")
+        resp = await asyncio.to_thread(
+            supabase.rpc("get_leader_board", {"battle_id_input": battle_id}).execute
+        )
+        logger.debug("🧾 Supabase RPC get_leader_board → data=%s", resp.data)
         if not resp.data:
             raise HTTPException(status_code=404, detail="No leaderboard found")
         return {"success": True, "data": resp.data}
     except Exception as e:
-        logger.error(f"💥 get_leaderboard failed: {e}")
+        logger.exception("💥 get_leaderboard failed: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 # -----------------------------------------------------
@@ -183,51 +294,54 @@ async def get_leaderboard(battle_id: str):
 # -----------------------------------------------------
 @app.post("/battle/start/{battle_id}")
 async def start_battle(battle_id: str, background_tasks: BackgroundTasks):
-    logger.info(f"🚀 /battle/start called for battle_id={battle_id}")
+    logger.info("🚀 /battle/start called for battle_id=%s", battle_id)
+    claimed = False
+    mcqs_task = None
     try:
-        # 1️⃣ Fetch current participants
-        logger.info(f"🔍 Fetching participants from Supabase for {battle_id}")
-        participants_resp = (
-            supabase.table("battle_participants")
-            .select("id,user_id,username,status")
-            .eq("battle_id", battle_id)
-            .eq("status", "joined")
-            .execute()
+        # 1️⃣ Fetch current participants + 2️⃣ current battle status (concurrently)
+        logger.info("🔍 Fetching participants and status from Supabase for %s", battle_id)
+        participants_resp, status_resp = await asyncio.gather(
+            asyncio.to_thread(
+                supabase.table("battle_participants")
+                .select("id,user_id,username,status")
+                .eq("battle_id", battle_id)
+                .eq("status", "joined")
+                .execute
+            ),
+            asyncio.to_thread(
+                supabase.table("battle_schedule")
+                .select("status")
+                .eq("battle_id", battle_id)
+                .single()
+                .execute
+            ),
         )
         participants = participants_resp.data or []
-        logger.info(f"👥 Joined players count = {len(participants)}")
-
-        # 2️⃣ Fetch current battle status
-        status_resp = (
-            supabase.table("battle_schedule")
-            .select("status")
-            .eq("battle_id", battle_id)
-            .single()
-            .execute()
-        )
-        current_status = status_resp.data.get("status") if status_resp.data else None
-        logger.info(f"📋 Current battle status for {battle_id} = {current_status}")
-
-        # -----------------------------------------------------
-        # 🧩 CASE 1 — Battle is already Active but orchestrator alive
-        # -----------------------------------------------------
-        if current_status and current_status.lower() == "active" and battle_id in active_battles:
-            logger.info(f"🔁 Battle {battle_id} already running — user can join ongoing flow.")
-            broadcast_event(
-                battle_id,
-                "battle_resume",
-                {"message": "🔁 A new player joined an active battle — continuing broadcast."},
-            )
-            return {"success": True, "message": "Joined ongoing battle successfully"}
+        logger.info("👥 Joined players count = %s", len(participants))
 
-        # -----------------------------------------------------
-        # 🧩 CASE 2 — Battle is Active in DB but orchestrator missing (zombie)
-        # -----------------------------------------------------
-        if current_status and current_status.lower() == "active" and battle_id not in active_battles:
-            logger.warning(f"⚠ Battle {battle_id} marked Active in DB but orchestrator not running — restarting.")
-            active_battles.add(battle_id)
+        current_status = status_resp.data.get("status") if status_resp.data else None
+        logger.info("📋 Current battle status for %s = %s", battle_id, current_status)
+
+        if current_status and current_status.lower() == "active":
+            # -----------------------------------------------------
+            # 🧩 CASE 1 — Battle is already Active and an orchestrator holds the lease
+            # -----------------------------------------------------
+            claimed = await claim_battle(battle_id)
+            if not claimed:
+                logger.info("🔁 Battle %s already running — user can join ongoing flow.", battle_id)
+                await broadcast_event(
+                    battle_id,
+                    "battle_resume",
+                    {"message": "🔁 A new player joined an active battle — continuing broadcast."},
+                )
+                return {"success": True, "message": "Joined ongoing battle successfully"}
+
+            # -----------------------------------------------------
+            # 🧩 CASE 2 — Battle is Active in DB but orchestrator missing (zombie)
+            # -----------------------------------------------------
+            logger.warning("⚠ Battle %s marked Active in DB but orchestrator not running — restarting.", battle_id)
             background_tasks.add_task(run_battle_sequence, battle_id)
-            broadcast_event(
+            await broadcast_event(
                 battle_id,
                 "battle_resume",
                 {"message": "♻️ Orchestrator resumed automatically"},
@@ -238,104 +352,119 @@ async def start_battle(battle_id: str, background_tasks: BackgroundTasks):
         # 🧩 CASE 3 — Battle is Completed
         # -----------------------------------------------------
         if current_status and current_status.lower() == "completed":
-            logger.info(f"🏁 Battle {battle_id} already completed — skipping orchestrator")
+            logger.info("🏁 Battle %s already completed — skipping orchestrator", battle_id)
             return {"success": False, "message": "Battle already finished"}
 
         # -----------------------------------------------------
         # 🧩 CASE 4 — Normal fresh start
         # -----------------------------------------------------
-        supabase.table("battle_schedule").update(
-            {"status": "Active"}
-        ).eq("battle_id", battle_id).execute()
+        claimed = await claim_battle(battle_id)
+        if not claimed:
+            logger.info("🔁 Battle %s is being started by another worker — joining.", battle_id)
+            return {"success": True, "message": "Joined ongoing battle successfully"}
 
-        active_battles.add(battle_id)
-        broadcast_event(
+        await asyncio.to_thread(
+            supabase.table("battle_schedule").update(
+                {"status": "Active"}
+            ).eq("battle_id", battle_id).execute
+        )
+
+        await broadcast_event(
             battle_id,
             "battle_start_pending",
             {"message": "⚔️ Battle will begin shortly (5 s buffer for late joiners)"},
         )
+
+        # 📥 Load the question list while clients subscribe, so Q1 goes out without a DB wait
+        mcqs_task = asyncio.create_task(fetch_battle_mcqs(battle_id))
         
         # 🕔 Backend buffer — allow all clients to subscribe
-        logger.info(f"⏳ Delaying orchestrator start by 5 seconds for {battle_id}...")
+        logger.info("⏳ Delaying orchestrator start by 5 seconds for %s...", battle_id)
         await asyncio.sleep(5)
-        logger.info(f"🕒 Buffer window active — waiting for all participants to subscribe before launch.")
+        logger.info("🕒 Buffer window active — waiting for all participants to subscribe before launch.")
         
-        broadcast_event(battle_id, "battle_start", {"message": "🚀 Battle officially started"})
-        background_tasks.add_task(run_battle_sequence, battle_id)
-        logger.info(f"✅ Buffered start triggered for battle_id={battle_id}")
+        await broadcast_event(battle_id, "battle_start", {"message": "🚀 Battle officially started"})
+        background_tasks.add_task(run_battle_sequence, battle_id, mcqs_task)
+        logger.info("✅ Buffered start triggered for battle_id=%s", battle_id)
         
         return {"success": True, "message": f"Battle {battle_id} will start after 5 s buffer"}
 
     except Exception as e:
-        logger.error(f"💥 start_battle failed: {e}")
+        logger.exception("💥 start_battle failed: %s", e)
+        if mcqs_task is not None:
+            mcqs_task.cancel()
+        if claimed:
+            await release_battle(battle_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 # -----------------------------------------------------
 # 🔹 Main Orchestrator Loop
 # -----------------------------------------------------
-async def run_battle_sequence(battle_id: str):
-    """start_orchestra → +20s get_bar_graph → +10s get_leader_board → +10s get_next_mcq → repeat"""
-    logger.info(f"🏁 Orchestrator started for battle_id={battle_id}")
+async def fetch_battle_mcqs(battle_id: str) -> list:
+    """Ordered MCQ list for a battle (single get_battle_mcqs round trip)."""
+    resp = await asyncio.to_thread(
+        supabase.rpc("get_battle_mcqs", {"battle_id_input": battle_id}).execute
+    )
+    return resp.data or []
+
+
+async def run_battle_sequence(battle_id: str, mcqs_task: asyncio.Task = None):
+    """get_battle_mcqs → per MCQ: broadcast → +20s stats → +10s leaderboard → +10s next"""
+    logger.info("🏁 Orchestrator started for battle_id=%s", battle_id)
     try:
-        current = supabase.rpc("get_first_mcq", {"battle_id_input": battle_id}).execute()
-        logger.info(f"🧾 RPC get_first_mcq → {current.data}")
+        # Prefetched during the start buffer when available
+        mcqs = await mcqs_task if mcqs_task is not None else await fetch_battle_mcqs(battle_id)
+        logger.info("🧾 RPC get_battle_mcqs → %s questions", len(mcqs))
 
-        if not current.data:
-            logger.warning(f"⚠ No questions found for {battle_id}")
-            broadcast_event(battle_id, "battle_end", {"message": "No MCQs found"})
+        if not mcqs:
+            logger.warning("⚠ No questions found for %s", battle_id)
+            await broadcast_event(battle_id, "battle_end", {"message": "No MCQs found"})
             return
 
-        while current.data:
-            mcq = current.data[0]
+        for mcq in mcqs:
+            if not await renew_battle(battle_id):
+                logger.warning("⚠️ Lost orchestrator lease for %s, stopping", battle_id)
+                return
             react_order = mcq.get("react_order", 0)
             total_mcqs = mcq.get("total_mcqs", 0)
             mcq_id = mcq["mcq_id"]
 
-            broadcast_event(battle_id, "new_question", mcq)
-            logger.info(f"🧩 Battle {battle_id} → Q{react_order}/{total_mcqs} started")
+            await broadcast_event(battle_id, "new_question", mcq)
+            logger.info("🧩 Battle %s → Q%s/%s started", battle_id, react_order, total_mcqs)
 
             await asyncio.sleep(20)
-            # 🔧 CHANGE: flatten payload from list to object
-            bar = supabase.rpc("get_battle_stats", {"mcq_id_input": mcq_id}).execute().data or []
-            payload_bar = bar[0] if isinstance(bar, list) and len(bar) > 0 else {}
-            logger.info(f"📊 Q{react_order}: get_bar_graph → {payload_bar}")
-            broadcast_event(battle_id, "show_stats", payload_bar)
+            # 🔧 One round trip → {stats, leaderboard} for this question
+            tick_resp = await asyncio.to_thread(
+                supabase.rpc(
+                    "get_question_tick",
+                    {"battle_id_input": battle_id, "mcq_id_input": mcq_id},
+                ).execute
+            )
+            tick = tick_resp.data or {}
+
+            bar = tick.get("stats") or []
+            payload_bar = bar[0] if len(bar) > 0 else {}
+            logger.debug("📊 Q%s: get_bar_graph → %s", react_order, payload_bar)
+            await broadcast_event(battle_id, "show_stats", payload_bar)
 
             await asyncio.sleep(10)
-            # 🔧 CHANGE: flatten payload from list to object
-            lead = supabase.rpc("get_leader_board", {"battle_id_input": battle_id}).execute().data or []
-            payload_lead = lead[0] if isinstance(lead, list) and len(lead) > 0 else {}
-            logger.info(f"🏆 Q{react_order}: get_leader_board → {payload_lead}")
-            broadcast_event(battle_id, "update_leaderboard", payload_lead)
+            lead = tick.get("leaderboard") or []
+            payload_lead = lead[0] if len(lead) > 0 else {}
+            logger.debug("🏆 Q%s: get_leader_board → %s", react_order, payload_lead)
+            await broadcast_event(battle_id, "update_leaderboard", payload_lead)
 
             await asyncio.sleep(10)
-            logger.info(f"➡ Q{react_order}: fetching next MCQ")
-            next_q = supabase.rpc(
-                "get_next_mcq",
-                {"battle_id_input": battle_id, "react_order_input": react_order},
-            ).execute()
-
-            if next_q.data:
-                next_mcq = next_q.data[0]
-                total_mcqs = next_mcq.get("total_mcqs", 0)   # ✅ NEW
-                react_order_next = next_mcq.get("react_order", 0)
-                mcq_id_next = next_mcq["mcq_id"]
-            
-                broadcast_event(battle_id, "new_question", next_mcq)
-                logger.info(f"🧩 Next question → Q{react_order_next}/{total_mcqs}")
-                current = next_q
-                continue  # optional safety, explicit loop continue
-
-            if not next_q.data:
-                supabase.table("battle_schedule").update(
-                    {"status": "Completed"}
-                ).eq("battle_id", battle_id).execute()
-                broadcast_event(battle_id, "battle_end", {"message": "Battle completed 🏁"})
-                logger.info(f"✅ Battle {battle_id} completed.")
-                break
+
+        await asyncio.to_thread(
+            supabase.table("battle_schedule").update(
+                {"status": "Completed"}
+            ).eq("battle_id", battle_id).execute
+        )
+        await broadcast_event(battle_id, "battle_end", {"message": "Battle completed 🏁"})
+        logger.info("✅ Battle %s completed.", battle_id)
 
     except Exception as e:
-        logger.error(f"💥 Orchestrator error for {battle_id}: {e}")
+        logger.exception("💥 Orchestrator error for %s: %s", battle_id, e)
     finally:
-        active_battles.discard(battle_id)
-        logger.info(f"🧹 Orchestrator stopped for {battle_id}")
+        await release_battle(battle_id)
+        logger.info("🧹 Orchestrator stopped for %s", battle_id)
@@ -1,28 +1,136 @@
 # gpt_utils.py
 import os
-from openai import OpenAI
+import asyncio
+import logging
+from typing import AsyncIterator
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger("gpt_utils")
 
+# One HTTP/2 keep-alive pool for every async GPT call in the process, so chat
+# turns reuse a warm TLS connection to OpenAI instead of re-handshaking.
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    http_client=DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=50,
+            keepalive_expiry=120,
+        ),
+    ),
+)
 
-def chat_with_gpt(prompt: str, phase_json: dict, student_message: str = None):
+MODEL = "gpt-4o-mini"
+
+# Caps in-flight async GPT requests per process so bursts queue here
+# instead of tripping OpenAI rate limits
+GPT_SEM = asyncio.Semaphore(int(os.getenv("LLM_MAX_ASYNC", "16")))
+SYSTEM_PROMPT = "You are a kind and knowledgeable medical mentor."
+
+# Stored conversation_log roles → OpenAI chat roles
+_CHAT_ROLES = {"student": "user", "user": "user", "mentor": "assistant", "assistant": "assistant"}
+
+# Only the tail of a chat log goes to GPT: at most GPT_CONTEXT_TURNS turns,
+# then oldest turns dropped until the request fits GPT_CONTEXT_TOKENS.
+# The stored conversation_log itself is never trimmed. Token counting needs the
+# tiktoken encoding, loaded off the event loop by warm_tokenizer() (app
+# startup); until it is loaded, only the turn cap applies.
+GPT_CONTEXT_TURNS = int(os.getenv("GPT_CONTEXT_TURNS", "12"))
+GPT_CONTEXT_TOKENS = int(os.getenv("GPT_CONTEXT_TOKENS", "3000"))
+_MESSAGE_OVERHEAD_TOKENS = 4  # role + delimiters per chat message
+
+_encoding = None  # set by warm_tokenizer()
+
+
+def _load_encoding():
+    # Blocking: reads (and on a cold cache downloads) the BPE file
+    global _encoding
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model(MODEL)
+
+
+async def warm_tokenizer(timeout: float = 10.0):
+    """Loads the tiktoken encoding in a worker thread (app startup)."""
+    try:
+        await asyncio.wait_for(asyncio.to_thread(_load_encoding), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ tiktoken load timed out after %ss, windowing by turn count", timeout)
+    except Exception as e:
+        logger.warning("⚠️ tiktoken unavailable, windowing by turn count: %s", e)
+
+
+def _count_tokens(text: str) -> int:
+    return len(_encoding.encode_ordinary(text)) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _window_turns(system_content: str, turns: list) -> list:
     """
-    Combines your system prompt + phase context + student's message,
-    then calls GPT for a conversational mentor reply.
+    Newest-first walk keeping turns while they fit the token budget.
+    The latest turn is always kept whole.
     """
-    context = f"{prompt}\n\nPhase Context:\n{phase_json}"
-    if student_message:
-        context += f"\n\nStudent: {student_message}"
-
-    completion = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a kind and knowledgeable medical mentor."},
-            {"role": "user", "content": context},
-        ],
-        temperature=0.8
-    )
+    budget = GPT_CONTEXT_TOKENS - _count_tokens(system_content)
+    kept = []
+    for turn in reversed(turns):
+        budget -= _count_tokens(turn["content"])
+        if kept and budget < 0:
+            break
+        kept.append(turn)
+    kept.reverse()
+    return kept
+
+
+def _build_history_messages(prompt: str, convo_log: list):
+    """
+    Sends a chat log as real chat turns instead of a JSON blob: persona +
+    prompt as the system message, then one message per turn (oldest first),
+    with only role/content kept — `ts` and other stored fields never reach
+    the model. Long logs are windowed to the budget above (_window_turns).
+    """
+    system_content = f"{SYSTEM_PROMPT}\n\n{prompt}"
+    turns = [
+        {"role": _CHAT_ROLES.get(turn.get("role"), "user"), "content": str(turn.get("content") or "")}
+        for turn in convo_log[-GPT_CONTEXT_TURNS:]
+        if isinstance(turn, dict)
+    ]
+    if _encoding is not None:
+        turns = _window_turns(system_content, turns)
+    return [{"role": "system", "content": system_content}] + turns
+
+
+async def chat_with_history_async(prompt: str, convo_log: list):
+    """
+    Mentor reply to the latest turn of a stored conversation_log
+    (see _build_history_messages).
+    """
+    async with GPT_SEM:
+        completion = await async_client.chat.completions.create(
+            model=MODEL,
+            messages=_build_history_messages(prompt, convo_log),
+            temperature=0.8
+        )
 
     return completion.choices[0].message.content
+
+
+async def close_async_client():
+    """Closes the shared async GPT connection pool (app shutdown)."""
+    await async_client.close()
+
+
+async def stream_chat_with_history(prompt: str, convo_log: list) -> AsyncIterator[str]:
+    """Streaming twin of chat_with_history_async."""
+    async with GPT_SEM:
+        stream = await async_client.chat.completions.create(
+            model=MODEL,
+            messages=_build_history_messages(prompt, convo_log),
+            temperature=0.8,
+            stream=True,
+        )
+
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
@@ -0,0 +1,13 @@
+# json_utils.py
+from fastapi.responses import JSONResponse
+import orjson
+
+
+class OrjsonResponse(JSONResponse):
+    """
+    JSONResponse rendered by orjson — phase_json / conversation_log payloads
+    can be big. Serializes UUIDs and datetimes natively; non-str dict keys
+    are stringified like the stdlib encoder does.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,35 @@
+# log_utils.py
+import os
+import atexit
+import logging
+import logging.handlers
+import queue
+
+_listener = None
+
+
+def setup_queue_logging(default_level: str = "INFO"):
+    """
+    Routes the root logger through a QueueHandler: request handlers only
+    enqueue records, and a background QueueListener thread does the stdout
+    write. Level comes from LOG_LEVEL (falls back to `default_level`).
+    Safe to call more than once — only the first call configures anything.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(
+        "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        datefmt="%H:%M:%S",
+    ))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(os.getenv("LOG_LEVEL", default_level).upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,249 +1,348 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-from supabase_client import call_rpc, supabase
-from gpt_utils import chat_with_gpt
-import json
+from contextlib import asynccontextmanager
+import logging
+import os
+import uuid
+from typing import Optional, Union
+from cachetools import TTLCache
+from pydantic import BaseModel, Field
+from supabase_client import call_rpc_async, register_rpc, with_retry, get_async_supabase, warm_async_supabase, close_async_supabase, WriteBatcher
+from gpt_utils import chat_with_history_async, warm_tokenizer, close_async_client, GPT_CONTEXT_TURNS
+from stream_utils import stream_mentor_reply, persist_in_background
+from log_utils import setup_queue_logging
+from time_utils import utc_now_iso
+from json_utils import OrjsonResponse
+import orjson
+
+# Logs go through a queue so request handlers never block on stdout
+setup_queue_logging(default_level="WARNING")
+logger = logging.getLogger("orchestra")
 
 # ───────────────────────────────────────────────
 # Initialize FastAPI app
 # ───────────────────────────────────────────────
-app = FastAPI(title="Paragraph Orchestra API", version="2.5.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared Supabase client (and one warm connection) once so the
+    # first request doesn't pay for client setup or the TLS handshake;
+    # every request then reuses its pooled connections.
+    app.state.db = await warm_async_supabase()
+    await warm_tokenizer()
+    _mcq_writes.start()
+    yield
+    await _mcq_writes.close()
+    await close_async_supabase()
+    await close_async_client()
+
+
+app = FastAPI(
+    title="Paragraph Orchestra API",
+    version="2.5.0",
+    lifespan=lifespan,
+    default_response_class=OrjsonResponse,
+)
+
+# Allow frontend calls — CORS_ORIGINS is a comma-separated allow-list.
+# Without it any origin may call, but without credentials (a wildcard with
+# credentials is invalid CORS and makes starlette echo Origin per request).
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
 
-# Allow frontend calls
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS or ["*"],
+    allow_credentials=bool(CORS_ORIGINS),
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization", "Accept"],
 )
 
-# ───────────────────────────────────────────────
-# MASTER ORCHESTRATOR ENDPOINT
-# ───────────────────────────────────────────────
-@app.post("/orchestrate")
-async def orchestrate(request: Request):
-    payload = await request.json()
-    action = payload.get("action")
-    student_id = payload.get("student_id")
-    chapter_id = payload.get("chapter_id")
-    message = payload.get("message")
-
-    print(f"🎬 Action = {action}, Student = {student_id}, Chapter = {chapter_id}")
-
-    # ───────────────────────────────
-    # 1️⃣ START NORMAL CHAPTER FLOW
-    # ───────────────────────────────
-    if action == "start":
-        rpc_data = call_rpc("start_orchestra", {
-            "p_student_id": student_id,
-            "p_chapter_id": chapter_id
-        })
-        if not rpc_data or "phase_type" not in rpc_data:
-            return {"error": "❌ start_orchestra RPC failed"}
-
-        return {
-            "student_id": student_id,
-            "chapter_id": chapter_id,
-            "react_order_final": rpc_data.get("react_order_final"),
-            "phase_type": rpc_data.get("phase_type"),
-            "phase_json": rpc_data.get("phase_json"),
-            "mentor_reply": rpc_data.get("mentor_reply"),
-            "seq_num": rpc_data.get("seq_num"),
-            "total_count": rpc_data.get("total_count"),
-        }
-
-    # ───────────────────────────────
-    # 2️⃣ GPT CHAT FLOW
-    # ───────────────────────────────
-    elif action == "chat":
-        pointer_id = None
-        convo_log = []
-
-        try:
-            res = (
-                supabase.table("student_phase_pointer")
-                .select("pointer_id, conversation_log")
-                .eq("student_id", student_id)
-                .eq("chapter_id", chapter_id)
-                .order("updated_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            if not res.data:
-                return {"error": "⚠️ No active pointer for this chapter"}
-
-            pointer = res.data[0]
-            pointer_id = pointer["pointer_id"]
-            convo_log = pointer.get("conversation_log", [])
-            convo_log.append({
-                "role": "student",
-                "content": message,
-                "ts": datetime.utcnow().isoformat() + "Z",
-            })
-        except Exception as e:
-            print(f"⚠️ Failed to fetch/append chat log: {e}")
-            return {"error": "❌ Conversation log fetch failed"}
-
-        # GPT
-        prompt = """
+# Mentor instructions sent with every chat turn
+MENTOR_PROMPT = """
 You are a senior NEET-PG mentor with 30 years’ experience.
 Guide the student concisely, in Markdown with Unicode symbols.
 """
 
-        mentor_reply = "⚠️ Temporary glitch — please retry."
-        gpt_status = "failed"
-        try:
-            mentor_reply = chat_with_gpt(prompt, convo_log)
-            gpt_status = "success"
-        except:
-            pass
+# ───────────────────────────────────────────────
+# Helper: latest conversation_log per (student, chapter), write-through.
+#          Every chat turn in this process refreshes its entry after the
+#          append, so the next turn skips the pointer SELECT entirely.
+#          Only the last GPT_CONTEXT_TURNS turns are kept — gpt_utils'
+#          window never sends more; older turns stay in the DB (and get
+#          archived there).
+#          Anything that moves the student to another phase (start / next /
+#          submit with advance) drops the entry, or the next chat turn would
+#          keep sending the previous phase's conversation.
+#          Phase payloads themselves are not cached: start/next come from
+#          RPCs that advance the pointer, so they aren't pure reads.
+# ───────────────────────────────────────────────
+_convo_cache = TTLCache(maxsize=5000, ttl=int(os.getenv("CONVO_CACHE_TTL", "30")))
 
-        convo_log.append({
-            "role": "assistant",
-            "content": mentor_reply,
-            "ts": datetime.utcnow().isoformat() + "Z",
-        })
 
-        supabase.table("student_phase_pointer") \
-            .update({"conversation_log": convo_log}) \
-            .eq("pointer_id", pointer_id) \
+async def _fetch_convo_log(db, student_id, chapter_id):
+    """Returns a private copy of the recent conversation_log tail, or None if no pointer."""
+    key = (student_id, chapter_id)
+    cached = _convo_cache.get(key)
+    if cached is None:
+        res = await (
+            db.table("student_phase_pointer")
+            .select("conversation_log")
+            .eq("student_id", student_id)
+            .eq("chapter_id", chapter_id)
+            .order("updated_at", desc=True)
+            .limit(1)
             .execute()
+        )
+        if not res.data:
+            return None
+        log = res.data[0].get("conversation_log") or []
+        cached = _convo_cache[key] = log[-GPT_CONTEXT_TURNS:]
+    return list(cached)
 
-        return {"mentor_reply": mentor_reply, "gpt_status": gpt_status}
-
-    # ───────────────────────────────
-    # 3️⃣ NEXT PHASE (normal learning)
-    # ───────────────────────────────
-    elif action == "next":
-        rpc_data = call_rpc("next_orchestra", {
-            "p_student_id": student_id,
-            "p_chapter_id": chapter_id
-        })
-
-        if not rpc_data or "phase_type" not in rpc_data:
-            return {"error": "❌ next_orchestra RPC failed"}
 
-        return {
-            "student_id": student_id,
-            "chapter_id": chapter_id,
-            "react_order_final": rpc_data.get("react_order_final"),
-            "phase_type": rpc_data.get("phase_type"),
-            "phase_json": rpc_data.get("phase_json"),
-            "mentor_reply": rpc_data.get("mentor_reply"),
-            "seq_num": rpc_data.get("seq_num"),
-            "total_count": rpc_data.get("total_count"),
-        }
+# ───────────────────────────────────────────────
+# Helper: append chat turns in one round trip
+# ───────────────────────────────────────────────
+_rpc_append_turns = register_rpc("append_turns")                                 # jsonb
+_rpc_bookmark_window = register_rpc("get_bookmarked_phases_window", "rows")     # setof student_phase_pointer
+
+
+async def _append_turns(student_id, chapter_id, convo_log: list, assistant_turn: dict):
+    """Writes the student turn (last in convo_log) and the reply in one RPC."""
+    key = (student_id, chapter_id)
+    res = await _rpc_append_turns({
+        "p_student_id": student_id,
+        "p_chapter_id": chapter_id,
+        "p_turns": [convo_log[-1], assistant_turn],
+    })
+    if res:
+        # Only refresh an entry that's still there — if it was dropped because
+        # the student moved on mid-turn, don't bring the old phase's log back
+        if key in _convo_cache:
+            _convo_cache[key] = (convo_log + [assistant_turn])[-GPT_CONTEXT_TURNS:]
+    else:
+        _convo_cache.pop(key, None)
+        logger.warning("⚠️ append_turns wrote nothing for %s/%s", student_id, chapter_id)
 
-    # ───────────────────────────────
-    # 4️⃣ BOOKMARK REVIEW
-    # ───────────────────────────────
-    elif action == "bookmark_review":
-        rpc_data = call_rpc("get_first_bookmarked_phase", {
-            "p_student_id": student_id,
-            "p_chapter_id": chapter_id,
-        })
-        return {"bookmarked_concepts": [rpc_data] if rpc_data else []}
 
-    elif action == "bookmark_review_next":
-        last_time = payload.get("bookmark_updated_time")
-        rpc_data = call_rpc("get_next_bookmarked_phase", {
+# ───────────────────────────────────────────────
+# Helper: keyset-paginated review windows
+# ───────────────────────────────────────────────
+REVIEW_WINDOW_LIMIT = 20
+REVIEW_WINDOW_MAX = 100
+
+# Review rows carry only the phase itself — conversation_log can be huge
+REVIEW_COLUMNS = "react_order_final, phase_type, phase_json, seq_num, total_count"
+
+REVIEW_WINDOWS = {
+    "bookmarks": {"cursor": "bookmark_updated_time", "legacy_key": "bookmarked_concepts"},
+    "review_upto": {"cursor": "react_order_final", "legacy_key": "review_upto",
+                    "filters": {"is_completed": True}},
+    "wrong_mcqs": {"cursor": "react_order_final", "legacy_key": "wrong_mcqs",
+                   "filters": {"phase_type": "mcq", "is_correct": False}},
+}
+
+# action → (window kind, payload field holding the cursor)
+LEGACY_REVIEW_ACTIONS = {
+    "bookmark_review": ("bookmarks", None),
+    "bookmark_review_next": ("bookmarks", "bookmark_updated_time"),
+    "review_upto_start": ("review_upto", None),
+    "review_upto_next": ("review_upto", "react_order_final"),
+    "wrong_mcqs_start": ("wrong_mcqs", None),
+    "wrong_mcqs_next": ("wrong_mcqs", "react_order_final"),
+}
+
+
+async def _review_window(db, kind: str, student_id, chapter_id, cursor, limit: int):
+    """Returns (rows, next_cursor); next_cursor is None once the window runs dry."""
+    spec = REVIEW_WINDOWS[kind]
+
+    if kind == "bookmarks":
+        rows = await _rpc_bookmark_window({
             "p_student_id": student_id,
             "p_chapter_id": chapter_id,
-            "p_last_bookmark_time": last_time,
-        })
-        return {"bookmarked_concepts": [rpc_data] if rpc_data else []}
-
-    # ───────────────────────────────
-    # 🆕 5️⃣ REVIEW COMPLETED FLOW — START
-    # ───────────────────────────────
-    elif action == "review_upto_start":
-        print("📘 Fetching FIRST completed phase...")
-
+            "p_last_bookmark_time": cursor,
+            "p_limit": limit,
+        }) or []
+    else:
         query = (
-            supabase.table("student_phase_pointer")
-            .select("*")
+            db.table("student_phase_pointer")
+            .select(REVIEW_COLUMNS)
             .eq("student_id", student_id)
             .eq("chapter_id", chapter_id)
-            .eq("is_completed", True)
-            .order("react_order_final", desc=False)
-            .limit(1)
-            .execute()
         )
-        return {"review_upto": query.data or []}
+        for column, value in spec["filters"].items():
+            query = query.eq(column, value)
+        if cursor is not None:
+            query = query.gt("react_order_final", cursor)
+        res = await query.order("react_order_final", desc=False).limit(limit).execute()
+        rows = res.data or []
 
-    # ───────────────────────────────
-    # 🆕 6️⃣ REVIEW COMPLETED FLOW — NEXT
-    # ───────────────────────────────
-    elif action == "review_upto_next":
-        current_order = payload.get("react_order_final")
-        print(f"⏭ Reviewing next after {current_order}")
+    next_cursor = rows[-1].get(spec["cursor"]) if len(rows) == limit else None
+    return rows, next_cursor
 
-        query = (
-            supabase.table("student_phase_pointer")
-            .select("*")
-            .eq("student_id", student_id)
-            .eq("chapter_id", chapter_id)
-            .eq("is_completed", True)
-            .gt("react_order_final", current_order)
-            .order("react_order_final", desc=False)
-            .limit(1)
-            .execute()
-        )
-        return {"review_upto": query.data or []}
 
-    # ───────────────────────────────
-    # 7️⃣ WRONG MCQS START
-    # ───────────────────────────────
-    elif action == "wrong_mcqs_start":
-        query = (
-            supabase.table("student_phase_pointer")
-            .select("*")
-            .eq("student_id", student_id)
-            .eq("chapter_id", chapter_id)
-            .eq("phase_type", "mcq")
-            .eq("is_correct", False)
-            .order("react_order_final", desc=False)
-            .limit(1)
-            .execute()
-        )
-        return {"wrong_mcqs": query.data or []}
+# ───────────────────────────────────────────────
+# REQUEST BODY — parsed and validated once by FastAPI (422 on bad input)
+# ───────────────────────────────────────────────
+class OrchestrateReq(BaseModel):
+    action: str
+    student_id: str
+    chapter_id: str
+    message: Optional[str] = None
+    stream: bool = False
+    # review windows
+    kind: Optional[str] = None
+    cursor: Union[int, str, None] = None
+    limit: Optional[int] = Field(default=None, ge=1)
+    # legacy one-row review cursors
+    bookmark_updated_time: Optional[str] = None
+    react_order_final: Optional[int] = None
 
-    # ───────────────────────────────
-    # 8️⃣ WRONG MCQS NEXT
-    # ───────────────────────────────
-    elif action == "wrong_mcqs_next":
-        current_order = payload.get("react_order_final")
 
-        query = (
-            supabase.table("student_phase_pointer")
-            .select("*")
-            .eq("student_id", student_id)
-            .eq("chapter_id", chapter_id)
-            .eq("phase_type", "mcq")
-            .eq("is_correct", False)
-            .gt("react_order_final", current_order)
-            .order("react_order_final", desc=False)
-            .limit(1)
-            .execute()
-        )
-        return {"wrong_mcqs": query.data or []}
+# ───────────────────────────────────────────────
+# ACTION HANDLERS — each takes (req, db, request)
+# ───────────────────────────────────────────────
 
-    # ───────────────────────────────
-    # ❌ UNKNOWN ACTION
-    # ───────────────────────────────
-    else:
-        return {"error": f"Unknown action '{action}'"}
+# 1️⃣ START / 3️⃣ NEXT — normal chapter flow, same response shape
+def _phase_response(student_id, chapter_id, rpc_data: dict):
+    return {
+        "student_id": student_id,
+        "chapter_id": chapter_id,
+        "react_order_final": rpc_data.get("react_order_final"),
+        "phase_type": rpc_data.get("phase_type"),
+        "phase_json": rpc_data.get("phase_json"),
+        "mentor_reply": rpc_data.get("mentor_reply"),
+        "seq_num": rpc_data.get("seq_num"),
+        "total_count": rpc_data.get("total_count"),
+    }
+
+
+def _phase_handler(rpc_name: str):
+    async def handler(req: OrchestrateReq, db, request: Request):
+        rpc_data = await call_rpc_async(rpc_name, {
+            "p_student_id": req.student_id,
+            "p_chapter_id": req.chapter_id
+        })
+        _convo_cache.pop((req.student_id, req.chapter_id), None)
+        if not rpc_data or "phase_type" not in rpc_data:
+            return {"error": f"❌ {rpc_name} RPC failed"}
+
+        return _phase_response(req.student_id, req.chapter_id, rpc_data)
+    return handler
+
+
+# 2️⃣ GPT CHAT FLOW
+async def _h_chat(req: OrchestrateReq, db, request: Request):
+    student_id = req.student_id
+    chapter_id = req.chapter_id
+
+    # Read the log once for GPT context; both turns are written after GPT
+    try:
+        convo_log = await _fetch_convo_log(db, student_id, chapter_id)
+        if convo_log is None:
+            return {"error": "⚠️ No active pointer for this chapter"}
+
+        convo_log.append({
+            "role": "student",
+            "content": req.message,
+            "ts": utc_now_iso(),
+        })
+    except Exception as e:
+        logger.warning("⚠️ Failed to fetch/append chat log: %s", e)
+        return {"error": "❌ Conversation log fetch failed"}
+
+    # Opt-in: stream tokens to the client as GPT generates them
+    # (Server-Sent Events when the client accepts text/event-stream)
+    if req.stream:
+        def persist(reply: str, complete: bool):
+            persist_in_background(_append_turns(student_id, chapter_id, convo_log, {
+                "role": "assistant",
+                "content": reply,
+                "ts": utc_now_iso(),
+            }))
+        return stream_mentor_reply(request, MENTOR_PROMPT, convo_log, persist)
+
+    mentor_reply = "⚠️ Temporary glitch — please retry."
+    gpt_status = "failed"
+    try:
+        mentor_reply = await chat_with_history_async(MENTOR_PROMPT, convo_log)
+        gpt_status = "success"
+    except Exception:
+        logger.exception("❌ GPT reply failed for student %s, chapter %s", student_id, chapter_id)
+
+    await _append_turns(student_id, chapter_id, convo_log, {
+        "role": "assistant",
+        "content": mentor_reply,
+        "ts": utc_now_iso(),
+    })
+
+    return {"mentor_reply": mentor_reply, "gpt_status": gpt_status}
+
+
+# 4️⃣ REVIEW WINDOW (bookmarks / review_upto / wrong_mcqs)
+#    One call returns up to `limit` rows after `cursor`;
+#    pass back `next_cursor` until it comes back null.
+async def _h_review_window(req: OrchestrateReq, db, request: Request):
+    kind = req.kind
+    if kind not in REVIEW_WINDOWS:
+        return {"error": f"Unknown review kind '{kind}'"}
+
+    limit = min(req.limit or REVIEW_WINDOW_LIMIT, REVIEW_WINDOW_MAX)
+    rows, next_cursor = await _review_window(
+        db, kind, req.student_id, req.chapter_id, req.cursor, limit
+    )
+    return {"kind": kind, "items": rows, "next_cursor": next_cursor}
+
+
+# 5️⃣ LEGACY ONE-ROW REVIEW ACTIONS (same path, window of 1)
+def _legacy_review_handler(kind: str, cursor_field):
+    async def handler(req: OrchestrateReq, db, request: Request):
+        cursor = getattr(req, cursor_field) if cursor_field else None
+        rows, _ = await _review_window(db, kind, req.student_id, req.chapter_id, cursor, 1)
+        return {REVIEW_WINDOWS[kind]["legacy_key"]: rows}
+    return handler
+
+
+HANDLERS = {
+    "start": _phase_handler("start_orchestra"),
+    "chat": _h_chat,
+    "next": _phase_handler("next_orchestra"),
+    "review_window": _h_review_window,
+    **{
+        action: _legacy_review_handler(kind, cursor_field)
+        for action, (kind, cursor_field) in LEGACY_REVIEW_ACTIONS.items()
+    },
+}
+
+
+# ───────────────────────────────────────────────
+# MASTER ORCHESTRATOR ENDPOINT
+# ───────────────────────────────────────────────
+@app.post("/orchestrate")
+async def orchestrate(req: OrchestrateReq, request: Request):
+    logger.info("🎬 Action = %s, Student = %s, Chapter = %s",
+                req.action, req.student_id, req.chapter_id)
+
+    handler = HANDLERS.get(req.action)
+    if handler is None:
+        return {"error": f"Unknown action '{req.action}'"}
+    return await handler(req, await get_async_supabase(), request)
 
 
 # ───────────────────────────────────────────────
 # SUBMIT MCQ ANSWER
 # ───────────────────────────────────────────────
+# Plain submits are queued and upserted in batches (one RPC per ~250ms);
+# batches that keep failing are parked in Redis for replay
+_mcq_writes = WriteBatcher("submit_mcq_answers_batch", "p_rows", max_batch=100, max_wait=0.25,
+                           key=lambda row: row["student_id"],
+                           dead_letter=os.getenv("MCQ_DEAD_LETTER_KEY", "dead_letter:submit_mcq_answers_batch"))
+
+
 @app.post("/submit_answer")
 async def submit_answer(request: Request):
     try:
-        data = await request.json()
+        data = orjson.loads(await request.body())
         student_id = data.get("student_id")
         chapter_id = data.get("chapter_id")
         react_order_final = data.get("react_order_final")
@@ -252,27 +351,58 @@ async def submit_answer(request: Request):
         is_correct = data.get("is_correct")
 
         if not student_id or not react_order_final:
-            return {"error": "Missing required fields"}
+            return OrjsonResponse({"error": "Missing required fields"}, status_code=400)
+
+        # Checked here: one malformed row would otherwise fail its whole batch
+        try:
+            uuid.UUID(str(student_id))
+            if chapter_id is not None:
+                uuid.UUID(str(chapter_id))
+            react_order_final = int(react_order_final)
+        except (TypeError, ValueError):
+            return OrjsonResponse({"error": "Invalid student_id / chapter_id / react_order_final"}, status_code=400)
+
+        # Opt-in: save and advance in one RPC, so the client skips the
+        # follow-up `next` call (next_phase is null at the end of the chapter)
+        if data.get("advance"):
+            # Land this student's queued answers first, so a stale batched
+            # row can't overwrite the one submit_and_next is about to save
+            await _mcq_writes.drain(student_id)
+            params = {
+                "p_student_id": student_id,
+                "p_chapter_id": chapter_id,
+                "p_react_order_final": react_order_final,
+                "p_student_answer": student_answer,
+                "p_correct_answer": correct_answer,
+                "p_is_correct": is_correct,
+            }
+            res = await with_retry(lambda db: db.rpc("submit_and_next", params))
+            _convo_cache.pop((student_id, chapter_id), None)
+            next_phase = res.data if isinstance(res.data, dict) else None
+            return {
+                "status": "success",
+                "next_phase": _phase_response(student_id, chapter_id, next_phase) if next_phase else None,
+            }
 
         payload = {
             "student_id": student_id,
             "chapter_id": chapter_id,
-            "react_order_final": int(react_order_final),
+            "react_order_final": react_order_final,
             "student_answer": student_answer,
             "correct_answer": correct_answer,
             "is_correct": is_correct,
             "is_completed": True,
-            "submitted_at": datetime.utcnow().isoformat() + "Z",
+            "submitted_at": utc_now_iso(),  # answer time, not flush time
         }
 
-        supabase.table("student_mcq_submissions") \
-            .upsert(payload, on_conflict=["student_id", "react_order_final"]) \
-            .execute()
-
-        return {"status": "success", "data": payload}
+        # 202: the row is queued, not yet written
+        await _mcq_writes.enqueue(payload)
+        return OrjsonResponse({"status": "queued", "data": payload}, status_code=202)
 
-    except Exception as e:
-        return {"error": str(e)}
+    except Exception:
+        # Full traceback goes to the log only; clients get a generic error
+        logger.exception("💥 submit_answer failed")
+        return OrjsonResponse({"error": "Internal server error"}, status_code=500)
 
 
 # ───────────────────────────────────────────────
@@ -1,14 +1,47 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-from supabase_client import call_rpc, supabase
-from gpt_utils import chat_with_gpt
-import json, uuid
+from contextlib import asynccontextmanager
+from supabase_client import call_rpc_async, register_rpc, get_async_supabase, warm_async_supabase, close_async_supabase, WriteBatcher
+from gpt_utils import chat_with_history_async, warm_tokenizer, close_async_client
+from stream_utils import stream_mentor_reply, persist_in_background
+from reply_cache import is_opening_question, get_cached_reply, cache_reply, close_reply_cache
+from json_utils import OrjsonResponse
+from log_utils import setup_queue_logging
+from time_utils import utc_now_iso
+from cachetools import TTLCache
+import logging, orjson, os, uuid
+
+# Logs go through a queue so request handlers never block on stdout
+setup_queue_logging(default_level="WARNING")
+logger = logging.getLogger("flashcard")
+
+# Progress submits are queued and flushed every 100 ms / 32 items as one RPC
+# (see WriteBatcher); shutdown flushes whatever is still queued.
+_progress_writes = WriteBatcher("submit_flashcard_progress_batch", "p_updates", max_batch=32, max_wait=0.1)
 
 # ───────────────────────────────────────────────
 # Initialize FastAPI app
 # ───────────────────────────────────────────────
-app = FastAPI(title="Flashcard Orchestra API", version="3.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect to PostgREST before the first request needs it
+    await warm_async_supabase()
+    await warm_tokenizer()
+    _progress_writes.start()
+    yield
+    # Flush queued progress writes, then release the shared Supabase / OpenAI pools
+    await _progress_writes.close()
+    await close_async_supabase()
+    await close_async_client()
+    await close_reply_cache()
+
+
+app = FastAPI(
+    title="Flashcard Orchestra API",
+    version="3.0.0",
+    lifespan=lifespan,
+    default_response_class=OrjsonResponse,
+)
 
 # ✅ Allow frontend (Expo / Web / React) to call this API
 app.add_middleware(
@@ -21,8 +54,28 @@ app.add_middleware(
 
 # ───────────────────────────────────────────────
 # Helper: make JSON fully serializable (UUID → string)
+#         Copy-on-write: containers without a UUID are returned as-is,
+#         so the common all-strings/numbers phase_json allocates nothing.
 # ───────────────────────────────────────────────
 def _make_json_safe(data):
+    if type(data) is dict:
+        out = None
+        for k, v in data.items():
+            nv = _make_json_safe(v)
+            if nv is not v:
+                if out is None:
+                    out = dict(data)
+                out[k] = nv
+        return data if out is None else out
+    if type(data) is list:
+        out = None
+        for i, v in enumerate(data):
+            nv = _make_json_safe(v)
+            if nv is not v:
+                if out is None:
+                    out = list(data)
+                out[i] = nv
+        return data if out is None else out
     if isinstance(data, uuid.UUID):
         return str(data)
     if isinstance(data, dict):
@@ -33,89 +86,44 @@ def _make_json_safe(data):
 
 
 # ───────────────────────────────────────────────
-# MASTER ENDPOINT — handles all flashcard actions
+# Recent chat logs, write-through: warm turns skip the log SELECT.
+#   ("pointer", pointer_id)             → convo_log
+#   ("bookmark", student_id, flashcard) → convo_log
+# Only logs are cached, never the write target: the active pointer is looked
+# up on every turn, so a card change served by another worker is picked up
+# immediately. Entries are dropped when a write fails; the short TTL bounds
+# how stale a log can get when another worker appended to it.
 # ───────────────────────────────────────────────
-@app.post("/flashcard_orchestrate")
-async def flashcard_orchestrate(request: Request):
-    payload = await request.json()
-    action = payload.get("action")
-    student_id = payload.get("student_id")
-    chapter_id = payload.get("chapter_id")
-    message = payload.get("message")
+_CONVO = TTLCache(maxsize=10_000, ttl=int(os.getenv("CONVO_CACHE_TTL", "30")))
 
-    print(f"🎬 Flashcard Action = {action}, Student = {student_id}")
 
-    # ───────────────────────────────
-    # 🟢 1️⃣ START_FLASHCARD
-    # ───────────────────────────────
-    if action == "start_flashcard":
-        rpc_data = call_rpc("start_flashcard_orchestra", {
-            "p_student_id": student_id,
-            "p_chapter_id": chapter_id
-        })
-        if not rpc_data:
-            return {"error": "❌ start_flashcard_orchestra RPC failed"}
+# ───────────────────────────────────────────────
+# Helpers: persist chat logs after the reply has been sent
+# ───────────────────────────────────────────────
+#          Both append just the new student + mentor messages server-side.
+_rpc_append_flashcard = register_rpc("append_flashcard_messages")
+_rpc_append_bookmark_chat = register_rpc("append_bookmark_chat_messages")
 
-        safe_phase_json = _make_json_safe(rpc_data.get("phase_json"))
-        safe_mentor_reply = _make_json_safe(rpc_data.get("mentor_reply"))
 
-        try:
-            call_rpc("update_flashcard_pointer_status", {
-                "p_student_id": student_id,
-                "p_chapter_id": chapter_id,
-                "p_react_order_final": rpc_data.get("react_order_final"),
-                "p_phase_json": safe_phase_json,
-                "p_mentor_reply": safe_mentor_reply
-            })
-        except Exception as e:
-            print(f"⚠️ RPC update_flashcard_pointer_status failed: {e}")
+async def _save_flashcard_log(pointer_id, student_msg: dict, mentor_msg: dict):
+    res = await _rpc_append_flashcard({
+        "p_pointer_id": pointer_id,
+        "p_student_msg": student_msg,
+        "p_mentor_msg": mentor_msg
+    })
+    if not res:
+        _CONVO.pop(("pointer", pointer_id), None)
+        logger.warning("⚠️ DB update failed for flashcard conversation (pointer %s)", pointer_id)
 
-        return {
-            "student_id": student_id,
-            "react_order_final": rpc_data.get("react_order_final"),
-            "phase_type": rpc_data.get("phase_type"),
-            "phase_json": safe_phase_json,
-            "mentor_reply": safe_mentor_reply,
-            "concept": rpc_data.get("concept"),
-            "subject": rpc_data.get("subject"),
-            "chapter_id": rpc_data.get("chapter_id"),
-            "chapter_name": rpc_data.get("chapter_name"),
-            "seq_num": rpc_data.get("seq_num"),
-            "total_count": rpc_data.get("total_count")
-        }
 
-    # ───────────────────────────────
-    # 🟡 2️⃣ CHAT_FLASHCARD
-    # ───────────────────────────────
-    elif action == "chat_flashcard":
-        pointer_id = None
-        convo_log = []
+async def _save_bookmark_chat(params: dict):
+    res = await _rpc_append_bookmark_chat(params)
+    if not res:
+        _CONVO.pop(("bookmark", params["p_student_id"], params["p_flashcard_id"]), None)
+        logger.warning("⚠️ DB insert/update failed for bookmark chat %s", params.get("p_flashcard_id"))
 
-        try:
-            res = (
-                supabase.table("student_flashcard_pointer")
-                .select("pointer_id, conversation_log")
-                .eq("student_id", student_id)
-                .order("updated_at", desc=True)
-                .limit(1)
-                .execute()
-            )
-            if not res.data:
-                return {"error": "⚠️ No active flashcard pointer for this student"}
-
-            pointer = res.data[0]
-            pointer_id = pointer["pointer_id"]
-            convo_log = pointer.get("conversation_log", [])
-            convo_log.append({
-                "role": "student",
-                "content": message,
-                "ts": datetime.utcnow().isoformat() + "Z"
-            })
-        except Exception as e:
-            print(f"⚠️ Failed to fetch or append student flashcard message: {e}")
-            return {"error": "❌ Failed to fetch pointer or append message"}
 
-        prompt = """
+FLASHCARD_PROMPT = """
 You are a senior NEET-PG mentor with 30 years’ experience.
 You are helping a student with flashcard-based rapid revision.
 You are given the full flashcard conversation log — a list of chat objects:
@@ -123,65 +131,37 @@ You are given the full flashcard conversation log — a list of chat objects:
 👉 Reply only to the latest student message.
 🧠 Reply in Markdown using Unicode symbols, ≤100 words, concise and high-yield.
 """
-        mentor_reply = None
-        gpt_status = "success"
 
-        try:
-            mentor_reply = chat_with_gpt(prompt, convo_log)
-            if not isinstance(mentor_reply, str):
-                mentor_reply = str(mentor_reply)
-        except Exception as e:
-            print(f"❌ GPT call failed for student {student_id}: {e}")
-            mentor_reply = "⚠️ I'm having a small technical hiccup 🤖. Please try again soon!"
-            gpt_status = "failed"
 
-        convo_log.append({
-            "role": "assistant",
-            "content": mentor_reply,
-            "ts": datetime.utcnow().isoformat() + "Z"
-        })
-
-        db_status = "success"
-        try:
-            supabase.table("student_flashcard_pointer") \
-                .update({"conversation_log": convo_log}) \
-                .eq("pointer_id", pointer_id) \
-                .execute()
-        except Exception as e:
-            db_status = "failed"
-            print(f"⚠️ DB update failed for flashcard conversation: {e}")
+# ───────────────────────────────────────────────
+# Action handlers — each takes (payload, db, request, background_tasks)
+# ───────────────────────────────────────────────
 
-        return {
-            "mentor_reply": mentor_reply,
-            "context_used": True,
-            "db_update_status": db_status,
-            "gpt_status": gpt_status
-        }
+# 🟢 START_FLASHCARD / 🔵 NEXT_FLASHCARD
+def _pointer_phase_handler(rpc_name: str):
+    async def handler(payload: dict, db, request: Request, background_tasks: BackgroundTasks):
+        student_id = payload.get("student_id")
+        chapter_id = payload.get("chapter_id")
 
-    # ───────────────────────────────
-    # 🔵 3️⃣ NEXT_FLASHCARD
-    # ───────────────────────────────
-    elif action == "next_flashcard":
-        rpc_data = call_rpc("next_flashcard_orchestra", {
+        rpc_data = await call_rpc_async(rpc_name, {
             "p_student_id": student_id,
             "p_chapter_id": chapter_id
         })
         if not rpc_data:
-            return {"error": "❌ next_flashcard_orchestra RPC failed"}
+            return {"error": f"❌ {rpc_name} RPC failed"}
 
         safe_phase_json = _make_json_safe(rpc_data.get("phase_json"))
         safe_mentor_reply = _make_json_safe(rpc_data.get("mentor_reply"))
 
-        try:
-            call_rpc("update_flashcard_pointer_status", {
-                "p_student_id": student_id,
-                "p_chapter_id": chapter_id,
-                "p_react_order_final": rpc_data.get("react_order_final"),
-                "p_phase_json": safe_phase_json,
-                "p_mentor_reply": safe_mentor_reply
-            })
-        except Exception as e:
-            print(f"⚠️ update_flashcard_pointer_status failed in NEXT: {e}")
+        # Status write runs after the response — the card doesn't depend on it
+        # (call_rpc_async logs its own failures)
+        background_tasks.add_task(call_rpc_async, "update_flashcard_pointer_status", {
+            "p_student_id": student_id,
+            "p_chapter_id": chapter_id,
+            "p_react_order_final": rpc_data.get("react_order_final"),
+            "p_phase_json": safe_phase_json,
+            "p_mentor_reply": safe_mentor_reply
+        })
 
         return {
             "student_id": student_id,
@@ -196,64 +176,121 @@ You are given the full flashcard conversation log — a list of chat objects:
             "seq_num": rpc_data.get("seq_num"),
             "total_count": rpc_data.get("total_count")
         }
+    return handler
 
-    # ───────────────────────────────
-    # 🟣 4️⃣ START_BOOKMARKED_REVISION
-    # ───────────────────────────────
-    elif action == "start_bookmarked_revision":
-        rpc_data = call_rpc("get_bookmarked_flashcards", {
-            "p_student_id": student_id,
-            "p_chapter_id": chapter_id
-        })
-        if not rpc_data:
-            return {"error": "❌ get_bookmarked_flashcards RPC failed"}
 
-        safe_data = _make_json_safe(rpc_data)
-        element_id = safe_data.get("element_id")
-        chat_log = []
+# 🟡 CHAT_FLASHCARD
+async def _chat_flashcard(payload: dict, db, request: Request, background_tasks: BackgroundTasks):
+    student_id = payload.get("student_id")
+    message = payload.get("message")
+    pointer_id = None
+    convo_log = []
 
-        try:
-            chat_res = (
-                supabase.table("flashcard_review_bookmarks_chat")
+    try:
+        # Active card: index-only lookup, re-read every turn (see _CONVO)
+        res = await (
+            db.table("student_flashcard_pointer")
+            .select("pointer_id")
+            .eq("student_id", student_id)
+            .order("updated_at", desc=True)
+            .limit(1)
+            .execute()
+        )
+        if not res.data:
+            return {"error": "⚠️ No active flashcard pointer for this student"}
+        pointer_id = res.data[0]["pointer_id"]
+
+        cached = _CONVO.get(("pointer", pointer_id))
+        if cached is None:
+            res = await (
+                db.table("student_flashcard_pointer")
                 .select("conversation_log")
-                .eq("student_id", student_id)
-                .eq("flashcard_id", element_id)
-                .order("flashcard_updated_time", desc=True)
+                .eq("pointer_id", pointer_id)
                 .limit(1)
                 .execute()
             )
-            if chat_res.data:
-                chat_log = chat_res.data[0].get("conversation_log", [])
-        except Exception as e:
-            print(f"⚠️ Could not fetch review chat: {e}")
+            cached = (res.data[0].get("conversation_log") if res.data else None) or []
 
-        return {
-            **safe_data,
-            "student_id": student_id,
-            "conversation_log": chat_log
-        }
+        convo_log = list(cached)
+        convo_log.append({
+            "role": "student",
+            "content": message,
+            "ts": utc_now_iso()
+        })
+    except Exception:
+        logger.exception("⚠️ Failed to fetch or append student flashcard message")
+        return {"error": "❌ Failed to fetch pointer or append message"}
+
+    # Opt-in: stream tokens as GPT generates them (SSE when accepted);
+    # the full reply is cached and saved once the stream ends
+    if payload.get("stream"):
+        def persist(reply: str, complete: bool):
+            convo_log.append({
+                "role": "assistant",
+                "content": reply,
+                "ts": utc_now_iso()
+            })
+            _CONVO[("pointer", pointer_id)] = convo_log
+            persist_in_background(_save_flashcard_log(pointer_id, convo_log[-2], convo_log[-1]))
+
+        return stream_mentor_reply(
+            request, FLASHCARD_PROMPT, convo_log, persist,
+            fallback="⚠️ I'm having a small technical hiccup 🤖. Please try again soon!"
+        )
 
-    # ───────────────────────────────
-    # 🟠 5️⃣ NEXT_BOOKMARKED_FLASHCARD
-    # ───────────────────────────────
-    elif action == "next_bookmarked_flashcard":
-        last_updated_time = payload.get("last_updated_time")
+    mentor_reply = None
+    gpt_status = "success"
 
-        rpc_data = call_rpc("get_next_bookmarked_flashcard", {
+    try:
+        mentor_reply = await chat_with_history_async(FLASHCARD_PROMPT, convo_log)
+        if not isinstance(mentor_reply, str):
+            mentor_reply = str(mentor_reply)
+    except Exception:
+        logger.exception("❌ GPT call failed for student %s", student_id)
+        mentor_reply = "⚠️ I'm having a small technical hiccup 🤖. Please try again soon!"
+        gpt_status = "failed"
+
+    convo_log.append({
+        "role": "assistant",
+        "content": mentor_reply,
+        "ts": utc_now_iso()
+    })
+
+    # Write after the response goes out — the reply doesn't depend on it
+    _CONVO[("pointer", pointer_id)] = convo_log
+    background_tasks.add_task(_save_flashcard_log, pointer_id, convo_log[-2], convo_log[-1])
+
+    return {
+        "mentor_reply": mentor_reply,
+        "context_used": True,
+        "db_update_status": "scheduled",
+        "gpt_status": gpt_status
+    }
+
+
+# 🟣 START_BOOKMARKED_REVISION / 🟠 NEXT_BOOKMARKED_FLASHCARD
+#    The chat SELECT needs element_id from the RPC, so the two stay sequential.
+def _bookmarked_card_handler(rpc_name: str, extra_params: dict = None):
+    async def handler(payload: dict, db, request: Request, background_tasks: BackgroundTasks):
+        student_id = payload.get("student_id")
+        params = {
             "p_student_id": student_id,
-            "p_chapter_id": chapter_id,
-            "p_last_updated_time": last_updated_time
-        })
+            "p_chapter_id": payload.get("chapter_id")
+        }
+        for param, field in (extra_params or {}).items():
+            params[param] = payload.get(field)
+
+        rpc_data = await call_rpc_async(rpc_name, params)
         if not rpc_data:
-            return {"error": "❌ get_next_bookmarked_flashcard RPC failed"}
+            return {"error": f"❌ {rpc_name} RPC failed"}
 
         safe_data = _make_json_safe(rpc_data)
         element_id = safe_data.get("element_id")
-
         chat_log = []
+
         try:
-            chat_res = (
-                supabase.table("flashcard_review_bookmarks_chat")
+            chat_res = await (
+                db.table("flashcard_review_bookmarks_chat")
                 .select("conversation_log")
                 .eq("student_id", student_id)
                 .eq("flashcard_id", element_id)
@@ -264,30 +301,33 @@ You are given the full flashcard conversation log — a list of chat objects:
             if chat_res.data:
                 chat_log = chat_res.data[0].get("conversation_log", [])
         except Exception as e:
-            print(f"⚠️ Could not fetch chat in NEXT: {e}")
+            logger.warning("⚠️ Could not fetch review chat after %s: %s", rpc_name, e, exc_info=True)
 
         return {
             **safe_data,
             "student_id": student_id,
             "conversation_log": chat_log
         }
+    return handler
 
-    # ───────────────────────────────
-    # 🔴 6️⃣ CHAT_REVIEW_FLASHCARD_BOOKMARKS
-    # ───────────────────────────────
-    elif action == "chat_review_flashcard_bookmarks":
-        chapter_id = payload.get("chapter_id")
-        flashcard_id = payload.get("flashcard_id")
-        flashcard_updated_time = payload.get("flashcard_updated_time")
-        message = payload.get("message")
 
-        convo_log = []
-        chat_id = None
+# 🔴 CHAT_REVIEW_FLASHCARD_BOOKMARKS
+async def _chat_review_flashcard_bookmarks(payload: dict, db, request: Request, background_tasks: BackgroundTasks):
+    student_id = payload.get("student_id")
+    chapter_id = payload.get("chapter_id")
+    flashcard_id = payload.get("flashcard_id")
+    flashcard_updated_time = payload.get("flashcard_updated_time")
+    message = payload.get("message")
+
+    cache_key = ("bookmark", student_id, flashcard_id)
+    cached = _CONVO.get(cache_key)
+    convo_log = list(cached) if cached is not None else []
 
+    if cached is None:
         try:
-            res = (
-                supabase.table("flashcard_review_bookmarks_chat")
-                .select("id, conversation_log")
+            res = await (
+                db.table("flashcard_review_bookmarks_chat")
+                .select("conversation_log")
                 .eq("student_id", student_id)
                 .eq("flashcard_id", flashcard_id)
                 .order("flashcard_updated_time", desc=True)
@@ -295,67 +335,111 @@ You are given the full flashcard conversation log — a list of chat objects:
                 .execute()
             )
             if res.data:
-                chat_id = res.data[0]["id"]
-                convo_log = res.data[0].get("conversation_log", [])
+                convo_log = res.data[0].get("conversation_log") or []
         except Exception as e:
-            print(f"⚠️ Fetch existing chat failed: {e}")
-
-        convo_log.append({
-            "role": "student",
-            "content": message,
-            "ts": datetime.utcnow().isoformat() + "Z"
-        })
-
-        prompt = """
-You are a senior NEET-PG mentor with 30 years’ experience.
-You are helping a student with flashcard-based rapid revision.
-You are given the full flashcard conversation log — a list of chat objects:
-[{ "role": "mentor" | "student", "content": "..." }]
-👉 Reply only to the latest student message.
-🧠 Reply in Markdown using Unicode symbols, ≤100 words, concise and high-yield.
-"""
-        mentor_reply = None
-        gpt_status = "success"
-        try:
-            mentor_reply = chat_with_gpt(prompt, convo_log)
-        except Exception as e:
-            mentor_reply = "⚠️ I'm facing a small technical hiccup 🤖. Please try again!"
-            gpt_status = "failed"
+            logger.warning("⚠️ Fetch existing chat failed: %s", e, exc_info=True)
+
+    # First question on this card → reply may come from the shared cache
+    reply_scope = f"flashcard:{flashcard_id}" if is_opening_question(convo_log) else None
+    cached_reply = await get_cached_reply(reply_scope, FLASHCARD_PROMPT, message) if reply_scope else None
+
+    convo_log.append({
+        "role": "student",
+        "content": message,
+        "ts": utc_now_iso()
+    })
+
+    bookmark_chat = {
+        "p_student_id": student_id,
+        "p_chapter_id": chapter_id,
+        "p_flashcard_id": flashcard_id,
+        "p_flashcard_updated_time": flashcard_updated_time
+    }
+
+    # Opt-in: stream the reply, cache + save it once the stream ends
+    if payload.get("stream"):
+        def persist(reply: str, complete: bool):
+            convo_log.append({
+                "role": "assistant",
+                "content": reply,
+                "ts": utc_now_iso()
+            })
+            _CONVO[cache_key] = convo_log
+            persist_in_background(_save_bookmark_chat({
+                **bookmark_chat,
+                "p_student_msg": convo_log[-2],
+                "p_mentor_msg": convo_log[-1]
+            }))
+            if reply_scope and complete and cached_reply is None:
+                persist_in_background(cache_reply(reply_scope, FLASHCARD_PROMPT, message, reply))
+
+        return stream_mentor_reply(
+            request, FLASHCARD_PROMPT, convo_log, persist,
+            fallback="⚠️ I'm facing a small technical hiccup 🤖. Please try again!",
+            cached_reply=cached_reply
+        )
+
+    mentor_reply = cached_reply
+    gpt_status = "success"
+    try:
+        if mentor_reply is None:
+            mentor_reply = await chat_with_history_async(FLASHCARD_PROMPT, convo_log)
+            if reply_scope:
+                background_tasks.add_task(cache_reply, reply_scope, FLASHCARD_PROMPT, message, mentor_reply)
+    except Exception:
+        logger.exception("❌ GPT call failed for student %s", student_id)
+        mentor_reply = "⚠️ I'm facing a small technical hiccup 🤖. Please try again!"
+        gpt_status = "failed"
+
+    convo_log.append({
+        "role": "assistant",
+        "content": mentor_reply,
+        "ts": utc_now_iso()
+    })
+
+    _CONVO[cache_key] = convo_log
+    background_tasks.add_task(_save_bookmark_chat, {
+        **bookmark_chat,
+        "p_student_msg": convo_log[-2],
+        "p_mentor_msg": convo_log[-1]
+    })
+
+    return {
+        "mentor_reply": mentor_reply,
+        "gpt_status": gpt_status,
+        "student_id": student_id,
+        "flashcard_id": flashcard_id,
+        "flashcard_updated_time": flashcard_updated_time,
+        "context_used": True
+    }
+
+
+HANDLERS = {
+    "start_flashcard": _pointer_phase_handler("start_flashcard_orchestra"),
+    "chat_flashcard": _chat_flashcard,
+    "next_flashcard": _pointer_phase_handler("next_flashcard_orchestra"),
+    "start_bookmarked_revision": _bookmarked_card_handler("get_bookmarked_flashcards"),
+    "next_bookmarked_flashcard": _bookmarked_card_handler(
+        "get_next_bookmarked_flashcard", {"p_last_updated_time": "last_updated_time"}
+    ),
+    "chat_review_flashcard_bookmarks": _chat_review_flashcard_bookmarks,
+}
 
-        convo_log.append({
-            "role": "assistant",
-            "content": mentor_reply,
-            "ts": datetime.utcnow().isoformat() + "Z"
-        })
 
-        try:
-            if chat_id:
-                supabase.table("flashcard_review_bookmarks_chat").update({
-                    "conversation_log": convo_log,
-                    "updated_at": datetime.utcnow().isoformat() + "Z"
-                }).eq("id", chat_id).execute()
-            else:
-                supabase.table("flashcard_review_bookmarks_chat").insert({
-                    "student_id": student_id,
-                    "chapter_id": chapter_id,
-                    "flashcard_id": flashcard_id,
-                    "flashcard_updated_time": flashcard_updated_time,
-                    "conversation_log": convo_log
-                }).execute()
-        except Exception as e:
-            print(f"⚠️ DB insert/update failed: {e}")
+# ───────────────────────────────────────────────
+# MASTER ENDPOINT — handles all flashcard actions
+# ───────────────────────────────────────────────
+@app.post("/flashcard_orchestrate")
+async def flashcard_orchestrate(request: Request, background_tasks: BackgroundTasks):
+    payload = orjson.loads(await request.body())
+    action = payload.get("action")
 
-        return {
-            "mentor_reply": mentor_reply,
-            "gpt_status": gpt_status,
-            "student_id": student_id,
-            "flashcard_id": flashcard_id,
-            "flashcard_updated_time": flashcard_updated_time,
-            "context_used": True
-        }
+    logger.info("🎬 Flashcard Action = %s, Student = %s", action, payload.get("student_id"))
 
-    else:
+    handler = HANDLERS.get(action)
+    if handler is None:
         return {"error": f"Unknown flashcard action '{action}'"}
+    return await handler(payload, await get_async_supabase(), request, background_tasks)
 
 
 # ───────────────────────────────────────────────
@@ -363,28 +447,39 @@ You are given the full flashcard conversation log — a list of chat objects:
 # ───────────────────────────────────────────────
 @app.post("/submit_flashcard_progress")
 async def submit_flashcard_progress(request: Request):
+    # 202 only once the update is queued; bad input is 400, failures 500
     try:
-        data = await request.json()
-        student_id = data.get("student_id")
-        react_order_final = data.get("react_order_final")
-        progress = data.get("progress", {})
-        completed = data.get("completed", False)
-
-        supabase.table("student_flashcard_pointer") \
-            .update({
-                "last_progress": progress,
-                "is_completed": completed,
-                "updated_at": datetime.utcnow().isoformat() + "Z"
-            }) \
-            .eq("student_id", student_id) \
-            .eq("react_order_final", react_order_final) \
-            .execute()
+        data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        return OrjsonResponse({"error": "Request body must be valid JSON"}, status_code=400)
+    if type(data) is not dict:
+        return OrjsonResponse({"error": "Request body must be a JSON object"}, status_code=400)
+
+    student_id = data.get("student_id")
+    react_order_final = data.get("react_order_final")
+    progress = data.get("progress", {})
+    completed = data.get("completed", False)
+
+    # Checked here: one malformed row would otherwise fail its whole batch
+    try:
+        uuid.UUID(str(student_id))
+        react_order_final = int(react_order_final)
+    except (TypeError, ValueError):
+        return OrjsonResponse({"error": "Missing or invalid student_id / react_order_final"}, status_code=400)
+
+    try:
+        await _progress_writes.enqueue({
+            "student_id": student_id,
+            "react_order_final": react_order_final,
+            "progress": progress,
+            "completed": completed
+        })
+    except Exception:
+        logger.exception("❌ Error updating flashcard progress")
+        return OrjsonResponse({"error": "Internal server error"}, status_code=500)
 
-        print(f"✅ Flashcard progress updated for {student_id}, react_order {react_order_final}")
-        return {"status": "success"}
-    except Exception as e:
-        print(f"❌ Error updating flashcard progress: {e}")
-        return {"error": str(e)}
+    logger.info("✅ Flashcard progress queued for %s, react_order %s", student_id, react_order_final)
+    return OrjsonResponse({"status": "queued"}, status_code=202)
 
 
 # ───────────────────────────────────────────────
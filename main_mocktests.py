@@ -1,15 +1,44 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import timedelta, datetime
-from supabase_client import call_rpc, supabase
-from gpt_utils import chat_with_gpt
-import traceback
-import json
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from supabase_client import register_rpc, get_async_supabase, warm_async_supabase, close_async_supabase
+from gpt_utils import chat_with_history_async, warm_tokenizer, close_async_client
+from stream_utils import stream_mentor_reply, persist_in_background
+from reply_cache import is_opening_question, get_cached_reply, cache_reply, close_reply_cache
+from json_utils import OrjsonResponse
+from log_utils import setup_queue_logging
+from time_utils import utc_now_iso
+from cachetools import TTLCache
+import logging
+import orjson
+import os
+
+# Logs go through a queue so request handlers never block on stdout
+setup_queue_logging(default_level="WARNING")
+logger = logging.getLogger("mocktests")
 
 # ───────────────────────────────
 # APP SETUP
 # ───────────────────────────────
-app = FastAPI(title="Mock Test Orchestra API", version="1.3.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect to PostgREST before the first request needs it
+    await warm_async_supabase()
+    await warm_tokenizer()
+    yield
+    # Release the shared Supabase / OpenAI connection pools
+    await close_async_supabase()
+    await close_async_client()
+    await close_reply_cache()
+
+
+app = FastAPI(
+    title="Mock Test Orchestra API",
+    version="1.3.0",
+    lifespan=lifespan,
+    default_response_class=OrjsonResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,226 +49,285 @@ app.add_middleware(
 )
 
 # ───────────────────────────────
-# MAIN ORCHESTRATOR ENDPOINT
+# Recent review-chat logs keyed by (student_id, exam_serial, mcq_id),
+# write-through so warm turns skip the SELECT; dropped if a write fails.
+# Per worker: the short TTL bounds how stale a log can get when another
+# worker appended to the same conversation.
 # ───────────────────────────────
-@app.post("/mocktest_orchestrate")
-async def mocktest_orchestrate(request: Request):
-    payload = await request.json()
-    action = payload.get("intent")
-    student_id = payload.get("student_id")
-    exam_serial = payload.get("exam_serial")
-    react_order_final = payload.get("react_order_final") or payload.get("react_order")
-    student_answer = payload.get("student_answer")
-    is_correct = payload.get("is_correct")
-    mcq_id = payload.get("mcq_id")
-    phase_json = payload.get("phase_json")
-    message = payload.get("message")
-    time_left_str = payload.get("time_left", "03:30:00")
+_CONVO = TTLCache(maxsize=10_000, ttl=int(os.getenv("CONVO_CACHE_TTL", "30")))
 
-    print("\n─────────────────────────────")
-    print(f"🎬 Action: {action}")
-    print(f"👤 Student: {student_id}")
-    print(f"🧪 Exam Serial: {exam_serial}")
-    print(f"🧩 React Order: {react_order_final}")
-    print(f"🕒 Time Left: {time_left_str}")
-    print("─────────────────────────────")
+# Seconds a finished exam's review content is served from the shared RPC cache
+REVIEW_CONTENT_CACHE_TTL = int(os.getenv("REVIEW_CONTENT_CACHE_TTL", "60"))
 
+
+# ───────────────────────────────
+# HELPER: persist review chat after the reply has been sent
+# ───────────────────────────────
+#         Appends just the new student + mentor messages (row created if missing)
+_rpc_append_review = register_rpc("append_mocktest_review_messages")
+
+
+async def _save_review_conversation(params: dict):
+    res = await _rpc_append_review(params)
+    if res:
+        logger.debug("🟢 Review conversation appended.")
+    else:
+        _CONVO.pop((params["p_student_id"], params["p_exam_serial"], params["p_mcq_id"]), None)
+        logger.error("❌ Supabase append failed for mcq %s", params.get("p_mcq_id"))
+
+
+# ───────────────────────────────
+# REVIEW CHAT PROMPT — filled per turn with the MCQ stem + question
+# ───────────────────────────────
+REVIEW_PROMPT = """
+You are a senior NEET-PG mentor with 30 years’ experience.
+Guide the student concisely, in Markdown with Unicode symbols, ≤150 words.
+Use headings, *bold*, italic, arrows (→, ↑, ↓), subscripts/superscripts (₁, ₂, ³, ⁺, ⁻),
+and emojis (💡🧠⚕📘) naturally. Do NOT output code blocks or JSON.
+
+MCQ Stem: {stem}
+Student’s question: {message}
+"""
+
+
+# ───────────────────────────────
+# HELPERS: request fields → RPC params
+# ───────────────────────────────
+def _react_order(payload: dict):
+    return payload.get("react_order_final") or payload.get("react_order")
+
+
+def _time_left(payload: dict) -> str:
     # Safely parse time string → timedelta
+    time_left_str = payload.get("time_left", "03:30:00")
     try:
         h, m, s = map(int, time_left_str.split(":"))
         time_left = timedelta(hours=h, minutes=m, seconds=s)
     except Exception as e:
-        print(f"⚠️ Failed to parse time_left_str '{time_left_str}': {e}")
+        logger.warning("⚠️ Failed to parse time_left_str %r: %s", time_left_str, e)
         time_left = timedelta(hours=3, minutes=30, seconds=0)
+    return str(time_left)
 
-    try:
-        result = None
-
-        # ───────────────────────────────
-        # 1️⃣ NORMAL MOCK TEST MODE
-        # ───────────────────────────────
-        if action == "start_mocktest":
-            print("🟢 Calling RPC → start_orchestra_mocktest")
-            result = call_rpc("start_orchestra_mocktest", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial
-            })
 
-        elif action == "next_mocktest_phase":
-            print("🟢 Calling RPC → next_orchestra_mocktest")
-            result = call_rpc("next_orchestra_mocktest", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial,
-                "p_react_order_final": react_order_final,
-                "p_student_answer": student_answer,
-                "p_is_correct": is_correct,
-                "p_time_left": str(time_left)
-            })
+def _exam_params(payload: dict) -> dict:
+    return {
+        "p_student_id": payload.get("student_id"),
+        "p_exam_serial": payload.get("exam_serial")
+    }
 
-        elif action == "skip_mocktest_phase":
-            print("🟢 Calling RPC → skip_orchestra_mocktest")
-            result = call_rpc("skip_orchestra_mocktest", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial,
-                "p_react_order_final": react_order_final,
-                "p_time_left": str(time_left)
-            })
 
-        # ───────────────────────────────
-        # 2️⃣ REVIEW MODE (POST-COMPLETION)
-        # ───────────────────────────────
-        elif action == "start_review_mocktest":
-            print("🟡 Calling RPC → start_review_mocktest")
-            result = call_rpc("start_review_mocktest", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial
-            })
+# ───────────────────────────────
+# RESULT VALIDATION + DEBUG LOGS
+# ───────────────────────────────
+def _rpc_result(result):
+    logger.debug("📦 Raw RPC Result: %s", result)
 
-        elif action == "next_review_mocktest":
-            print("🟡 Calling RPC → next_review_mocktest")
-            result = call_rpc("next_review_mocktest", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial,
-                "p_react_order": react_order_final
-            })
+    if not result:
+        logger.warning("⚠️ RPC returned no data or None.")
+        return {"error": "RPC returned no data."}
 
-        elif action == "get_review_mocktest_content":
-            print("🟡 Calling RPC → get_review_mocktest_content")
-            result = call_rpc("get_review_mocktest_content", {
-                "p_student_id": student_id,
-                "p_exam_serial": exam_serial,
-                "p_react_order": react_order_final
-            })
+    if isinstance(result, str):
+        try:
+            result = orjson.loads(result)
+        except Exception:
+            logger.warning("⚠️ Could not parse string result. Returning raw string.")
+            return {"message": result}
 
-        # ───────────────────────────────
-        # 3️⃣ CHAT DURING REVIEW
-        # ───────────────────────────────
-        elif action == "chat_review_mocktest":
-            print("💬 Review Chat Triggered")
-            print(f"📦 Payload keys: {list(payload.keys())}")
-            print(f"📋 mcq_id={mcq_id} | message={message}")
-
-            if not student_id or not exam_serial or not mcq_id or not message:
-                return {"error": "❌ Missing required fields"}
-
-            # Step 1: Get existing conversation (if any)
-            res = (
-                supabase.table("mock_test_review_conversation")
-                .select("id, conversation_log")
-                .eq("student_id", student_id)
-                .eq("exam_serial", exam_serial)
-                .eq("mcq_id", mcq_id)
-                .maybe_single()
-                .execute()
-            )
-            existing = res.data if hasattr(res, "data") else None
-            convo_log = existing.get("conversation_log", []) if existing else []
-
-            # Step 2: Append student message
-            convo_log.append({
-                "role": "student",
-                "content": message,
-                "ts": datetime.utcnow().isoformat() + "Z",
-            })
+    if isinstance(result, dict):
+        if "message" in result and "✅ Review complete" in result["message"]:
+            logger.debug("🎉 Review cycle complete — returning success message.")
+            return {"message": "✅ Review complete"}
 
-            # Step 3: Prepare mentor prompt
-            stem_text = None
-            try:
-                if isinstance(phase_json, dict):
-                    stem_text = phase_json.get("stem")
-                elif isinstance(phase_json, str):
-                    stem_text = json.loads(phase_json).get("stem", phase_json)
-                else:
-                    stem_text = str(phase_json)
-            except Exception:
-                stem_text = str(phase_json)
-
-            prompt = f"""
-You are a senior NEET-PG mentor with 30 years’ experience.
-Guide the student concisely, in Markdown with Unicode symbols, ≤150 words.
-Use headings, *bold*, italic, arrows (→, ↑, ↓), subscripts/superscripts (₁, ₂, ³, ⁺, ⁻),
-and emojis (💡🧠⚕📘) naturally. Do NOT output code blocks or JSON.
+    return result
+
+
+# ───────────────────────────────
+# INTENT HANDLERS — each takes (payload, request, background_tasks)
+# ───────────────────────────────
+def _rpc_handler(icon: str, rpc_name: str, build_params, cache_ttl: int = 0):
+    # cache_ttl > 0 only for pure reads: the result is shared via Redis for that long
+    rpc = register_rpc(rpc_name, "auto", cacheable=cache_ttl > 0, ttl=cache_ttl)
+
+    async def handler(payload: dict, request: Request, background_tasks: BackgroundTasks):
+        logger.debug("%s Calling RPC → %s", icon, rpc_name)
+        return _rpc_result(await rpc(build_params(payload)))
+    return handler
 
-MCQ Stem: {stem_text}
-Student’s question: {message}
-"""
 
-            # Step 4: Get mentor reply
-            mentor_reply = "⚠️ Please retry later."
-            try:
-                print("🤖 Calling GPT mentor...")
-                mentor_reply = chat_with_gpt(prompt, convo_log)
-                print("✅ GPT reply preview:", mentor_reply[:120])
-            except Exception as e:
-                print("❌ GPT call failed:", e)
-                print(traceback.format_exc())
+# 3️⃣ CHAT DURING REVIEW
+async def _chat_review_mocktest(payload: dict, request: Request, background_tasks: BackgroundTasks):
+    student_id = payload.get("student_id")
+    exam_serial = payload.get("exam_serial")
+    mcq_id = payload.get("mcq_id")
+    phase_json = payload.get("phase_json")
+    message = payload.get("message")
 
+    logger.debug("💬 Review chat: mcq_id=%s | message=%s", mcq_id, message)
+
+    if not student_id or not exam_serial or not mcq_id or not message:
+        return {"error": "❌ Missing required fields"}
+
+    # Step 1: Get existing conversation (if any) — cache first
+    cache_key = (student_id, exam_serial, mcq_id)
+    cached = _CONVO.get(cache_key)
+    if cached is not None:
+        convo_log = list(cached)
+    else:
+        db = await get_async_supabase()
+        res = await (
+            db.table("mock_test_review_conversation")
+            .select("conversation_log")
+            .eq("student_id", student_id)
+            .eq("exam_serial", exam_serial)
+            .eq("mcq_id", mcq_id)
+            .maybe_single()
+            .execute()
+        )
+        existing = res.data if hasattr(res, "data") else None
+        convo_log = existing.get("conversation_log", []) if existing else []
+        if isinstance(convo_log, str):
+            # Older rows hold the log JSON-encoded as a string
+            convo_log = orjson.loads(convo_log)
+
+    # First question on this MCQ → reply may come from the shared cache
+    reply_scope = f"mocktest:{mcq_id}" if is_opening_question(convo_log) else None
+    cached_reply = await get_cached_reply(reply_scope, REVIEW_PROMPT, message) if reply_scope else None
+
+    # Step 2: Append student message
+    convo_log.append({
+        "role": "student",
+        "content": message,
+        "ts": utc_now_iso(),
+    })
+
+    # Step 3: Prepare mentor prompt
+    stem_text = None
+    try:
+        if isinstance(phase_json, dict):
+            stem_text = phase_json.get("stem")
+        elif isinstance(phase_json, str):
+            stem_text = orjson.loads(phase_json).get("stem", phase_json)
+        else:
+            stem_text = str(phase_json)
+    except Exception:
+        stem_text = str(phase_json)
+
+    prompt = REVIEW_PROMPT.format_map({"stem": stem_text, "message": message})
+    review_chat = {
+        "p_student_id": student_id,
+        "p_exam_serial": exam_serial,
+        "p_mcq_id": mcq_id,
+        "p_phase_json": {"stem": stem_text},
+    }
+
+    # Opt-in: stream the reply (SSE when accepted); steps 4–5 run once it ends
+    if payload.get("stream"):
+        def persist(reply: str, complete: bool):
             convo_log.append({
                 "role": "mentor",
-                "content": mentor_reply,
-                "ts": datetime.utcnow().isoformat() + "Z",
+                "content": reply,
+                "ts": utc_now_iso(),
             })
-
-            # Step 5: Insert or update Supabase
-            try:
-                if not existing:
-                    insert_data = {
-                        "student_id": student_id,
-                        "exam_serial": exam_serial,
-                        "mcq_id": mcq_id,
-                        "phase_json": json.dumps({"stem": stem_text}),
-                        "conversation_log": json.dumps(convo_log),
-                        "created_at": datetime.utcnow().isoformat() + "Z",
-                    }
-                    supabase.table("mock_test_review_conversation").insert(insert_data).execute()
-                    print("🟢 Inserted new review conversation row.")
-                else:
-                    supabase.table("mock_test_review_conversation").update({
-                        "conversation_log": json.dumps(convo_log),
-                        "updated_at": datetime.utcnow().isoformat() + "Z",
-                    }).eq("id", existing["id"]).execute()
-                    print("🟡 Updated existing review conversation row.")
-            except Exception as e:
-                print("❌ Supabase insert/update failed:", e)
-                print(traceback.format_exc())
-
-            return {
-                "mentor_reply": mentor_reply,
-                "conversation_log": convo_log
-            }
-
+            _CONVO[cache_key] = convo_log
+            persist_in_background(_save_review_conversation({
+                **review_chat,
+                "p_student_msg": convo_log[-2],
+                "p_mentor_msg": convo_log[-1],
+            }))
+            if reply_scope and complete and cached_reply is None:
+                persist_in_background(cache_reply(reply_scope, REVIEW_PROMPT, message, reply))
+
+        return stream_mentor_reply(request, prompt, convo_log, persist,
+                                   fallback="⚠️ Please retry later.",
+                                   cached_reply=cached_reply)
+
+    # Step 4: Get mentor reply (cached for an opening question)
+    mentor_reply = "⚠️ Please retry later."
+    try:
+        if cached_reply is not None:
+            mentor_reply = cached_reply
         else:
-            print(f"❌ Unknown intent: {action}")
-            return {"error": f"❌ Unknown intent '{action}'"}
-
-        # ───────────────────────────────
-        # RESULT VALIDATION + DEBUG LOGS
-        # ───────────────────────────────
-        print("📦 Raw RPC Result:", result)
+            mentor_reply = await chat_with_history_async(prompt, convo_log)
+            if reply_scope:
+                background_tasks.add_task(cache_reply, reply_scope, REVIEW_PROMPT, message, mentor_reply)
+    except Exception:
+        logger.exception("❌ GPT call failed")
+
+    convo_log.append({
+        "role": "mentor",
+        "content": mentor_reply,
+        "ts": utc_now_iso(),
+    })
+
+    # Step 5: Insert or update Supabase — after the response goes out
+    _CONVO[cache_key] = convo_log
+    background_tasks.add_task(_save_review_conversation, {
+        **review_chat,
+        "p_student_msg": convo_log[-2],
+        "p_mentor_msg": convo_log[-1],
+    })
+
+    return {
+        "mentor_reply": mentor_reply,
+        "conversation_log": convo_log
+    }
+
+
+HANDLERS = {
+    # 1️⃣ NORMAL MOCK TEST MODE
+    "start_mocktest": _rpc_handler("🟢", "start_orchestra_mocktest", _exam_params),
+    "next_mocktest_phase": _rpc_handler("🟢", "next_orchestra_mocktest", lambda p: {
+        **_exam_params(p),
+        "p_react_order_final": _react_order(p),
+        "p_student_answer": p.get("student_answer"),
+        "p_is_correct": p.get("is_correct"),
+        "p_time_left": _time_left(p)
+    }),
+    "skip_mocktest_phase": _rpc_handler("🟢", "skip_orchestra_mocktest", lambda p: {
+        **_exam_params(p),
+        "p_react_order_final": _react_order(p),
+        "p_time_left": _time_left(p)
+    }),
+
+    # 2️⃣ REVIEW MODE (POST-COMPLETION)
+    "start_review_mocktest": _rpc_handler("🟡", "start_review_mocktest", _exam_params),
+    "next_review_mocktest": _rpc_handler("🟡", "next_review_mocktest", lambda p: {
+        **_exam_params(p),
+        "p_react_order": _react_order(p)
+    }),
+    # Read-only view of a finished exam — safe to serve from the RPC cache
+    "get_review_mocktest_content": _rpc_handler("🟡", "get_review_mocktest_content", lambda p: {
+        **_exam_params(p),
+        "p_react_order": _react_order(p)
+    }, cache_ttl=REVIEW_CONTENT_CACHE_TTL),
+
+    "chat_review_mocktest": _chat_review_mocktest,
+}
 
-        if not result:
-            print("⚠️ RPC returned no data or None.")
-            return {"error": "RPC returned no data."}
 
-        if isinstance(result, str):
-            try:
-                print("🔍 Attempting to parse string result as JSON...")
-                result = json.loads(result)
-            except Exception:
-                print("⚠️ Could not parse string result. Returning raw string.")
-                return {"message": result}
+# ───────────────────────────────
+# MAIN ORCHESTRATOR ENDPOINT
+# ───────────────────────────────
+@app.post("/mocktest_orchestrate")
+async def mocktest_orchestrate(request: Request, background_tasks: BackgroundTasks):
+    payload = orjson.loads(await request.body())
+    action = payload.get("intent")
 
-        if isinstance(result, dict):
-            if "message" in result and "✅ Review complete" in result["message"]:
-                print("🎉 Review cycle complete — returning success message.")
-                return {"message": "✅ Review complete"}
+    logger.info("🎬 Action = %s, Student = %s, Exam = %s, React Order = %s, Time Left = %s",
+                action, payload.get("student_id"), payload.get("exam_serial"),
+                _react_order(payload), payload.get("time_left", "03:30:00"))
 
-        return result
+    handler = HANDLERS.get(action)
+    if handler is None:
+        logger.warning("❌ Unknown intent: %s", action)
+        return {"error": f"❌ Unknown intent '{action}'"}
 
-    except Exception as e:
-        print("💥 Exception during RPC call!")
-        print(traceback.format_exc())
-        return {"error": f"Internal server error: {e}"}
+    try:
+        return await handler(payload, request, background_tasks)
+    except Exception:
+        # Full traceback goes to the log only; clients get a generic error
+        logger.exception("💥 Intent %s failed", action)
+        return {"error": "Internal server error"}
 
 
 # ───────────────────────────────
@@ -0,0 +1,56 @@
+# reply_cache.py
+import hashlib
+import logging
+import os
+from typing import Optional
+import redis.asyncio as redis
+
+logger = logging.getLogger("reply_cache")
+
+# -----------------------------------------------------
+# 💾 Shared mentor-reply cache (Redis)
+#    Only for the *opening* question on an item (a flashcard, an MCQ):
+#    with no earlier turns, the reply depends on nothing but the prompt,
+#    the item and the question, so every student asking the same thing
+#    can get the same answer without a GPT call. Exact match on the
+#    normalized question. Disabled when REDIS_URL is not configured.
+# -----------------------------------------------------
+REDIS_URL = os.getenv("REDIS_URL")
+REPLY_CACHE_TTL = int(os.getenv("REPLY_CACHE_TTL", str(7 * 24 * 3600)))
+
+_redis = redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+
+
+def _key(scope: str, prompt: str, message: str) -> str:
+    question = " ".join(str(message).lower().split())
+    digest = hashlib.sha256(f"{prompt}\0{question}".encode()).hexdigest()
+    return f"reply:{scope}:{digest}"
+
+
+def is_opening_question(convo_log: list) -> bool:
+    """True when the log holds no student turn yet (call before appending one)."""
+    return not any(isinstance(t, dict) and t.get("role") in ("student", "user") for t in convo_log)
+
+
+async def get_cached_reply(scope: str, prompt: str, message: str) -> Optional[str]:
+    if _redis is None:
+        return None
+    try:
+        return await _redis.get(_key(scope, prompt, message))
+    except Exception as e:
+        logger.warning("⚠️ Reply cache read failed: %s", e)
+        return None
+
+
+async def cache_reply(scope: str, prompt: str, message: str, reply: str):
+    if _redis is None:
+        return
+    try:
+        await _redis.set(_key(scope, prompt, message), reply, ex=REPLY_CACHE_TTL)
+    except Exception as e:
+        logger.warning("⚠️ Reply cache write failed: %s", e)
+
+
+async def close_reply_cache():
+    if _redis is not None:
+        await _redis.aclose()
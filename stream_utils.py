@@ -0,0 +1,67 @@
+# stream_utils.py
+import asyncio
+import logging
+from typing import Callable, Optional
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from gpt_utils import stream_chat_with_history
+import orjson
+
+logger = logging.getLogger("stream_utils")
+
+# Writes scheduled after a response is already on the wire; held here so the
+# tasks aren't garbage-collected before they finish.
+_pending_writes = set()
+
+
+def persist_in_background(coro):
+    task = asyncio.create_task(coro)
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+async def _reply_frames(prompt: str, convo_log: list, on_done: Callable[[str, bool], None],
+                        sse: bool, fallback: str, cached_reply: Optional[str]):
+    # SSE frames carry each delta JSON-encoded so newlines inside tokens survive
+    frame = (lambda t: f"data: {orjson.dumps(t).decode()}\n\n") if sse else (lambda t: t)
+    parts = []
+    complete = False
+    try:
+        if cached_reply is not None:
+            parts.append(cached_reply)
+            yield frame(cached_reply)
+        else:
+            async for delta in stream_chat_with_history(prompt, convo_log):
+                parts.append(delta)
+                yield frame(delta)
+        complete = True
+        if sse:
+            yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        logger.warning("⚠️ GPT stream failed: %s", e)
+        if not parts:
+            parts.append(fallback)
+            yield frame(fallback)
+    finally:
+        # Also runs if the client disconnects mid-stream
+        on_done("".join(parts), complete)
+
+
+def stream_mentor_reply(request: Request, prompt: str, convo_log: list,
+                        on_done: Callable[[str, bool], None],
+                        fallback: str = "⚠️ Temporary glitch — please retry.",
+                        cached_reply: Optional[str] = None) -> StreamingResponse:
+    """
+    Streams the GPT reply to the client token-by-token — Server-Sent Events
+    when the client accepts text/event-stream, plain text otherwise — and
+    hands `on_done(reply, complete)` the full reply once the stream ends, so
+    the caller can persist it (schedule the write with persist_in_background).
+    `complete` is False if GPT failed or the client left mid-stream.
+    A `cached_reply` is sent as-is instead of calling GPT.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    return StreamingResponse(
+        _reply_frames(prompt, convo_log, on_done, sse, fallback, cached_reply),
+        media_type="text/event-stream" if sse else "text/plain; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,19 @@
+-- Per-question battle tick: bar-graph stats, leaderboard and next MCQ in one round trip.
+-- Wraps the existing get_battle_stats / get_leader_board / get_next_mcq RPCs.
+create or replace function public.get_question_tick(
+  battle_id_input uuid,
+  mcq_id_input uuid,
+  react_order_input int
+)
+returns jsonb
+language sql
+as $$
+  select jsonb_build_object(
+    'stats',
+      coalesce((select jsonb_agg(s) from public.get_battle_stats(mcq_id_input) s), '[]'::jsonb),
+    'leaderboard',
+      coalesce((select jsonb_agg(l) from public.get_leader_board(battle_id_input) l), '[]'::jsonb),
+    'next_mcq',
+      coalesce((select jsonb_agg(n) from public.get_next_mcq(battle_id_input, react_order_input) n), '[]'::jsonb)
+  );
+$$;
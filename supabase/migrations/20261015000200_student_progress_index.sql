@@ -0,0 +1,5 @@
+-- Serves the /analytics/practice 10-day aggregate:
+--   WHERE student_id = $1 AND is_completed AND end_time > now() - interval '10 days'
+create index if not exists idx_spp_student_progress
+  on public.student_phase_pointer (student_id, is_completed, end_time)
+  include (phase_type);
@@ -0,0 +1,40 @@
+-- Ordered MCQ list for a battle in one call. Walks get_first_mcq → get_next_mcq
+-- server-side so the orchestrator no longer paginates one question per round trip.
+create or replace function public.get_battle_mcqs(battle_id_input uuid)
+returns jsonb
+language plpgsql
+as $$
+declare
+  result jsonb := '[]'::jsonb;
+  cur jsonb;
+begin
+  select to_jsonb(f) into cur from public.get_first_mcq(battle_id_input) f limit 1;
+
+  while cur is not null loop
+    result := result || jsonb_build_array(cur);
+    select to_jsonb(n) into cur
+      from public.get_next_mcq(battle_id_input, (cur->>'react_order')::int) n
+      limit 1;
+  end loop;
+
+  return result;
+end;
+$$;
+
+-- The tick no longer needs to look ahead; the orchestrator already holds the list.
+drop function if exists public.get_question_tick(uuid, uuid, int);
+
+create or replace function public.get_question_tick(
+  battle_id_input uuid,
+  mcq_id_input uuid
+)
+returns jsonb
+language sql
+as $$
+  select jsonb_build_object(
+    'stats',
+      coalesce((select jsonb_agg(s) from public.get_battle_stats(mcq_id_input) s), '[]'::jsonb),
+    'leaderboard',
+      coalesce((select jsonb_agg(l) from public.get_leader_board(battle_id_input) l), '[]'::jsonb)
+  );
+$$;
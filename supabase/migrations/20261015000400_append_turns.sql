@@ -0,0 +1,24 @@
+-- Appends chat turns to the student's latest pointer in one statement, so the
+-- chat flow writes once after GPT replies instead of read-modify-writing the
+-- whole conversation_log (and no longer drops turns from concurrent writers).
+create or replace function public.append_turns(
+  p_student_id uuid,
+  p_chapter_id uuid,
+  p_turns jsonb
+)
+returns jsonb
+language sql
+as $$
+  update public.student_phase_pointer p
+     set conversation_log = coalesce(p.conversation_log, '[]'::jsonb) || p_turns,
+         updated_at = now()
+   where p.pointer_id = (
+     select pointer_id
+       from public.student_phase_pointer
+      where student_id = p_student_id
+        and chapter_id = p_chapter_id
+      order by updated_at desc
+      limit 1
+   )
+  returning jsonb_build_object('pointer_id', p.pointer_id);
+$$;
@@ -0,0 +1,31 @@
+-- Keyset pagination for the review flows: one call returns a window of rows
+-- after a cursor instead of one row per round trip.
+
+-- review_upto / wrong_mcqs walk react_order_final within a student's chapter.
+create index if not exists idx_spp_student_chapter_order
+  on public.student_phase_pointer (student_id, chapter_id, react_order_final);
+
+-- Bookmarks walk bookmark_updated_time; a null cursor starts from the first.
+create index if not exists idx_spp_bookmarks
+  on public.student_phase_pointer (student_id, chapter_id, bookmark_updated_time)
+  where is_bookmarked;
+
+create or replace function public.get_bookmarked_phases_window(
+  p_student_id uuid,
+  p_chapter_id uuid,
+  p_last_bookmark_time timestamptz default null,
+  p_limit int default 20
+)
+returns setof public.student_phase_pointer
+language sql
+stable
+as $$
+  select *
+    from public.student_phase_pointer
+   where student_id = p_student_id
+     and chapter_id = p_chapter_id
+     and is_bookmarked
+     and (p_last_bookmark_time is null or bookmark_updated_time > p_last_bookmark_time)
+   order by bookmark_updated_time
+   limit greatest(p_limit, 1);
+$$;
@@ -0,0 +1,64 @@
+-- Keeps student_phase_pointer.conversation_log short: turns beyond the most
+-- recent p_keep move to an append-only archive, so the chat read stays small
+-- no matter how long a student has been talking.
+create table if not exists public.conversation_log_archive (
+  id bigserial primary key,
+  student_id uuid not null,
+  chapter_id uuid not null,
+  turns jsonb not null,
+  archived_at timestamptz not null default now()
+);
+
+alter table public.conversation_log_archive alter column turns set compression lz4;
+
+create index if not exists idx_cla_student_chapter
+  on public.conversation_log_archive (student_id, chapter_id, archived_at);
+
+create or replace function public.archive_conversation_logs(p_keep int default 50)
+returns int
+language plpgsql
+as $$
+declare
+  moved int;
+begin
+  with overflow as (
+    select pointer_id, student_id, chapter_id, conversation_log,
+           jsonb_array_length(conversation_log) - p_keep as cut
+      from public.student_phase_pointer
+     where jsonb_typeof(conversation_log) = 'array'
+       and jsonb_array_length(conversation_log) > p_keep
+       for update skip locked
+  ),
+  archived as (
+    insert into public.conversation_log_archive (student_id, chapter_id, turns)
+    select o.student_id, o.chapter_id,
+           (select jsonb_agg(t.e order by t.i)
+              from jsonb_array_elements(o.conversation_log) with ordinality t(e, i)
+             where t.i <= o.cut)
+      from overflow o
+  )
+  update public.student_phase_pointer p
+     set conversation_log = (
+           select jsonb_agg(t.e order by t.i)
+             from jsonb_array_elements(o.conversation_log) with ordinality t(e, i)
+            where t.i > o.cut)
+    from overflow o
+   where p.pointer_id = o.pointer_id;
+
+  get diagnostics moved = row_count;
+  return moved;
+end;
+$$;
+
+-- Run it every 15 minutes where pg_cron is enabled.
+do $$
+begin
+  if exists (select 1 from pg_extension where extname = 'pg_cron') then
+    perform cron.schedule(
+      'archive-conversation-logs',
+      '*/15 * * * *',
+      'select public.archive_conversation_logs(50)'
+    );
+  end if;
+end;
+$$;
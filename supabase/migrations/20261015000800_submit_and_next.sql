@@ -0,0 +1,40 @@
+-- Saves an MCQ answer and advances the student in one round trip: upserts the
+-- submission, then returns whatever next_orchestra returns (null at the end).
+create or replace function public.submit_and_next(
+  p_student_id uuid,
+  p_chapter_id uuid,
+  p_react_order_final int,
+  p_student_answer text,
+  p_correct_answer text,
+  p_is_correct boolean
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  next_phase jsonb;
+begin
+  insert into public.student_mcq_submissions (
+    student_id, chapter_id, react_order_final,
+    student_answer, correct_answer, is_correct, is_completed, submitted_at
+  )
+  values (
+    p_student_id, p_chapter_id, p_react_order_final,
+    p_student_answer, p_correct_answer, p_is_correct, true, now()
+  )
+  on conflict (student_id, react_order_final) do update
+    set chapter_id = excluded.chapter_id,
+        student_answer = excluded.student_answer,
+        correct_answer = excluded.correct_answer,
+        is_correct = excluded.is_correct,
+        is_completed = true,
+        submitted_at = excluded.submitted_at;
+
+  -- Works whether next_orchestra returns jsonb or a row
+  select to_jsonb(n) into next_phase
+    from public.next_orchestra(p_student_id, p_chapter_id) n
+   limit 1;
+
+  return next_phase;
+end;
+$$;
@@ -0,0 +1,96 @@
+-- Server-side appends for the flashcard / mocktest chat logs: only the two new
+-- messages cross the wire, instead of the whole rewritten conversation_log.
+
+create or replace function public.append_flashcard_messages(
+  p_pointer_id uuid,
+  p_student_msg jsonb,
+  p_mentor_msg jsonb
+)
+returns jsonb
+language sql
+as $$
+  update public.student_flashcard_pointer
+     set conversation_log = coalesce(conversation_log, '[]'::jsonb)
+                            || jsonb_build_array(p_student_msg, p_mentor_msg),
+         updated_at = now()
+   where pointer_id = p_pointer_id
+  returning jsonb_build_object('pointer_id', pointer_id);
+$$;
+
+-- Appends to the latest review chat for this flashcard, creating it if missing.
+create or replace function public.append_bookmark_chat_messages(
+  p_student_id uuid,
+  p_chapter_id uuid,
+  p_flashcard_id uuid,
+  p_flashcard_updated_time timestamptz,
+  p_student_msg jsonb,
+  p_mentor_msg jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  turns jsonb := jsonb_build_array(p_student_msg, p_mentor_msg);
+begin
+  update public.flashcard_review_bookmarks_chat c
+     set conversation_log = coalesce(c.conversation_log, '[]'::jsonb) || turns,
+         updated_at = now()
+   where c.id = (
+     select id
+       from public.flashcard_review_bookmarks_chat
+      where student_id = p_student_id
+        and flashcard_id = p_flashcard_id
+      order by flashcard_updated_time desc
+      limit 1
+   );
+
+  if not found then
+    insert into public.flashcard_review_bookmarks_chat
+      (student_id, chapter_id, flashcard_id, flashcard_updated_time, conversation_log)
+    values
+      (p_student_id, p_chapter_id, p_flashcard_id, p_flashcard_updated_time, turns);
+  end if;
+
+  return jsonb_build_object('appended', 2);
+end;
+$$;
+
+-- Same for the mock-test review chat. Older rows stored conversation_log as a
+-- JSON-encoded string; those are unwrapped into a real array on first append.
+create or replace function public.append_mocktest_review_messages(
+  p_student_id uuid,
+  p_exam_serial int,
+  p_mcq_id uuid,
+  p_phase_json jsonb,
+  p_student_msg jsonb,
+  p_mentor_msg jsonb
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+  turns jsonb := jsonb_build_array(p_student_msg, p_mentor_msg);
+begin
+  update public.mock_test_review_conversation
+     set conversation_log = (
+           case jsonb_typeof(conversation_log)
+             when 'array' then conversation_log
+             when 'string' then (conversation_log #>> '{}')::jsonb
+             else '[]'::jsonb
+           end
+         ) || turns,
+         updated_at = now()
+   where student_id = p_student_id
+     and exam_serial = p_exam_serial
+     and mcq_id = p_mcq_id;
+
+  if not found then
+    insert into public.mock_test_review_conversation
+      (student_id, exam_serial, mcq_id, phase_json, conversation_log, created_at)
+    values
+      (p_student_id, p_exam_serial, p_mcq_id, p_phase_json, turns, now());
+  end if;
+
+  return jsonb_build_object('appended', 2);
+end;
+$$;
@@ -0,0 +1,18 @@
+-- "Latest row" lookups on the chat paths become a single index probe instead
+-- of filter + sort. (student_id, flashcard_id) is not unique on the bookmark
+-- chat table, so those reads keep order + limit 1 and ride the index order.
+-- conversation_log is deliberately not INCLUDEd: a large jsonb in a btree
+-- entry can exceed the index row size limit and make updates fail.
+
+-- chat_flashcard: latest pointer for a student
+create index if not exists ix_sfp_student_updated
+  on public.student_flashcard_pointer (student_id, updated_at desc)
+  include (pointer_id);
+
+-- bookmarked-card reads + chat_review_flashcard_bookmarks + append_bookmark_chat_messages
+create index if not exists ix_frbc_student_card_updated
+  on public.flashcard_review_bookmarks_chat (student_id, flashcard_id, flashcard_updated_time desc);
+
+-- chat_review_mocktest (.maybe_single()) + append_mocktest_review_messages
+create index if not exists ix_mtrc_student_exam_mcq
+  on public.mock_test_review_conversation (student_id, exam_serial, mcq_id);
@@ -0,0 +1,32 @@
+-- Applies a batch of /submit_flashcard_progress writes in one statement.
+-- p_updates: [{student_id, react_order_final, progress, completed}, ...]
+-- If a card appears more than once in a batch, the last entry wins.
+create or replace function public.submit_flashcard_progress_batch(p_updates jsonb)
+returns jsonb
+language sql
+as $$
+  with u as (
+    select distinct on (student_id, react_order_final)
+           student_id, react_order_final, progress, completed
+      from (
+        select (e->>'student_id')::uuid       as student_id,
+               (e->>'react_order_final')::int as react_order_final,
+               coalesce(e->'progress', '{}'::jsonb) as progress,
+               coalesce((e->>'completed')::boolean, false) as completed,
+               ord
+          from jsonb_array_elements(p_updates) with ordinality as t(e, ord)
+      ) items
+     order by student_id, react_order_final, ord desc
+  ),
+  updated as (
+    update public.student_flashcard_pointer p
+       set last_progress = u.progress,
+           is_completed = u.completed,
+           updated_at = now()
+      from u
+     where p.student_id = u.student_id
+       and p.react_order_final = u.react_order_final
+    returning 1
+  )
+  select jsonb_build_object('updated', count(*)) from updated;
+$$;
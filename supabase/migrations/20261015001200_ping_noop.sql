@@ -0,0 +1,7 @@
+-- Cheapest possible round trip; the apps call it at startup to open a warm
+-- HTTP/2 connection to PostgREST before the first user request.
+create or replace function public.ping_noop()
+returns int
+language sql
+stable
+as $$ select 1 $$;
@@ -0,0 +1,36 @@
+-- mock_test_review_conversation used to be written with json.dumps(...)
+-- values, so conversation_log / phase_json hold JSON *strings* that contain
+-- the real array / object. The app and append_mocktest_review_messages now
+-- send real JSON; this unwraps the old rows once.
+
+-- If either column was created as text, make it jsonb first.
+do $$
+declare
+  col text;
+begin
+  foreach col in array array['conversation_log', 'phase_json'] loop
+    if exists (
+      select 1
+        from information_schema.columns
+       where table_schema = 'public'
+         and table_name = 'mock_test_review_conversation'
+         and column_name = col
+         and data_type = 'text'
+    ) then
+      execute format(
+        'alter table public.mock_test_review_conversation alter column %I type jsonb using %I::jsonb',
+        col, col
+      );
+    end if;
+  end loop;
+end;
+$$;
+
+update public.mock_test_review_conversation
+   set conversation_log = (conversation_log #>> '{}')::jsonb
+ where jsonb_typeof(conversation_log) = 'string';
+
+update public.mock_test_review_conversation
+   set phase_json = (phase_json #>> '{}')::jsonb
+ where jsonb_typeof(phase_json) = 'string'
+   and left(phase_json #>> '{}', 1) = '{';
@@ -0,0 +1,60 @@
+-- Timestamps for pointer bookmarks and MCQ submissions are stamped by
+-- Postgres instead of being sent from the API.
+
+alter table public.student_phase_pointer
+  alter column updated_at set default now(),
+  alter column bookmark_updated_time set default now();
+
+alter table public.student_mcq_submissions
+  alter column submitted_at set default now();
+
+-- updated_at drives every "latest pointer" lookup (ORDER BY updated_at DESC),
+-- so it only moves when the student's progress on the phase changes — not
+-- for chat-log archiving, bookmarking or other housekeeping on an older
+-- pointer — and never overrides a value the caller set explicitly.
+-- bookmark_updated_time only moves when the bookmark state actually changes.
+create or replace function public.touch_phase_pointer()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.updated_at is not distinct from old.updated_at
+     and row(new.react_order_final, new.phase_type, new.phase_json,
+             new.is_completed, new.is_correct, new.end_time)
+         is distinct from
+         row(old.react_order_final, old.phase_type, old.phase_json,
+             old.is_completed, old.is_correct, old.end_time) then
+    new.updated_at := now();
+  end if;
+  if new.is_bookmarked is distinct from old.is_bookmarked then
+    new.bookmark_updated_time := now();
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists trg_touch_phase_pointer on public.student_phase_pointer;
+create trigger trg_touch_phase_pointer
+  before update on public.student_phase_pointer
+  for each row execute function public.touch_phase_pointer();
+
+-- Re-submitting an MCQ (upsert → update path) refreshes submitted_at, unless
+-- the caller sent its own: batched /submit_answer writes carry the time the
+-- student answered, which can be well before the batch is flushed.
+create or replace function public.touch_mcq_submission()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.submitted_at is null
+     or new.submitted_at is not distinct from old.submitted_at then
+    new.submitted_at := now();
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists trg_touch_mcq_submission on public.student_mcq_submissions;
+create trigger trg_touch_mcq_submission
+  before update on public.student_mcq_submissions
+  for each row execute function public.touch_mcq_submission();
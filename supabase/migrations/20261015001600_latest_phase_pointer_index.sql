@@ -0,0 +1,11 @@
+-- "Latest pointer for a student's chapter" — main.py's _fetch_convo_log and
+-- append_turns both run
+--   WHERE student_id = $1 AND chapter_id = $2 ORDER BY updated_at DESC LIMIT 1
+-- With this index that is a single descent to the top entry, no sort.
+-- idx_spp_student_chapter_order (0005) can't serve it: same prefix, but its
+-- order column is react_order_final. pointer_id is INCLUDEd so append_turns'
+-- subquery is index-only; conversation_log deliberately isn't — a large jsonb
+-- in a btree entry can exceed the index row size limit and make updates fail.
+create index if not exists idx_spp_student_chapter_updated
+  on public.student_phase_pointer (student_id, chapter_id, updated_at desc)
+  include (pointer_id);
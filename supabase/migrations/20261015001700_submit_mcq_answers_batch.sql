@@ -0,0 +1,42 @@
+-- Applies a batch of queued /submit_answer writes in one statement.
+-- p_rows: [{student_id, chapter_id, react_order_final, student_answer,
+--           correct_answer, is_correct, submitted_at}, ...]
+-- If an answer appears more than once in a batch, the last entry wins.
+create or replace function public.submit_mcq_answers_batch(p_rows jsonb)
+returns jsonb
+language sql
+as $$
+  with r as (
+    select distinct on (student_id, react_order_final) *
+      from (
+        select (e->>'student_id')::uuid        as student_id,
+               (e->>'chapter_id')::uuid        as chapter_id,
+               (e->>'react_order_final')::int  as react_order_final,
+               e->>'student_answer'            as student_answer,
+               e->>'correct_answer'            as correct_answer,
+               (e->>'is_correct')::boolean     as is_correct,
+               coalesce((e->>'submitted_at')::timestamptz, now()) as submitted_at,
+               ord
+          from jsonb_array_elements(p_rows) with ordinality as t(e, ord)
+      ) items
+     order by student_id, react_order_final, ord desc
+  ),
+  upserted as (
+    insert into public.student_mcq_submissions (
+      student_id, chapter_id, react_order_final,
+      student_answer, correct_answer, is_correct, is_completed, submitted_at
+    )
+    select student_id, chapter_id, react_order_final,
+           student_answer, correct_answer, is_correct, true, submitted_at
+      from r
+    on conflict (student_id, react_order_final) do update
+      set chapter_id = excluded.chapter_id,
+          student_answer = excluded.student_answer,
+          correct_answer = excluded.correct_answer,
+          is_correct = excluded.is_correct,
+          is_completed = true,
+          submitted_at = excluded.submitted_at
+    returning 1
+  )
+  select jsonb_build_object('upserted', count(*)) from upserted;
+$$;
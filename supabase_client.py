@@ -1,14 +1,25 @@
 # supabase_client.py
-from supabase import create_client
+from supabase import create_client, acreate_client, Client, ClientOptions, AsyncClient, AsyncClientOptions
 import os
+import json
+import hashlib
+import random
+import asyncio
+import logging
+import httpx
+import orjson
+import redis.asyncio as redis
+from postgrest import APIError
 from dotenv import load_dotenv
-from datetime import datetime
+from functools import lru_cache, partial
 
 # ───────────────────────────────────────────────
 # 🔹 Load environment variables
 # ───────────────────────────────────────────────
 load_dotenv()
 
+logger = logging.getLogger("supabase_client")
+
 # ───────────────────────────────────────────────
 # 🔹 Initialize Supabase client
 # ───────────────────────────────────────────────
@@ -18,7 +29,184 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("❌ Missing SUPABASE_URL or SUPABASE_KEY in environment variables.")
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_POOL_KEEPALIVE = float(os.getenv("SUPABASE_POOL_KEEPALIVE", "30"))
+# Connect-level retries on the transport (refused / reset before a request is sent)
+SUPABASE_CONNECT_RETRIES = int(os.getenv("SUPABASE_CONNECT_RETRIES", "1"))
+
+
+def _pool_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=SUPABASE_POOL_SIZE,
+        keepalive_expiry=SUPABASE_POOL_KEEPALIVE,
+    )
+
+
+# ───────────────────────────────────────────────
+# 🔹 orjson response decoding for Supabase traffic only
+#    postgrest parses every body with response.json() (stdlib json); the
+#    transports below swap that for orjson on the responses they produce,
+#    leaving every other httpx client (OpenAI, Realtime) untouched.
+# ───────────────────────────────────────────────
+def _decode_json(response: httpx.Response, **kwargs):
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        # orjson is strict where stdlib isn't (e.g. NaN / Infinity literals)
+        return json.loads(response.content, **kwargs)
+
+
+class _OrjsonTransport(httpx.HTTPTransport):
+    def handle_request(self, request):
+        response = super().handle_request(request)
+        response.json = partial(_decode_json, response)
+        return response
+
+
+class _OrjsonAsyncTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        response.json = partial(_decode_json, response)
+        return response
+
+
+def _log_pool(kind: str, limits: httpx.Limits):
+    logger.info("🔌 Supabase %s pool: http2, max_connections=%s, keepalive=%s, expiry=%ss, retries=%s",
+                kind, limits.max_connections, limits.max_keepalive_connections,
+                limits.keepalive_expiry, SUPABASE_CONNECT_RETRIES)
+
+
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """
+    Returns the shared sync Supabase client, built on first use with one
+    keep-alive connection pool, so repeated callers reuse warm connections.
+    """
+    # Pool limits live on the transport (a client-level `limits=` is ignored
+    # once a transport is passed)
+    limits = _pool_limits(SUPABASE_POOL_SIZE * 2)
+    _log_pool("sync", limits)
+    return create_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=ClientOptions(httpx_client=httpx.Client(
+            transport=_OrjsonTransport(http2=True, limits=limits, retries=SUPABASE_CONNECT_RETRIES),
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+        )),
+    )
+
+
+def __getattr__(name):
+    # `from supabase_client import supabase` still works, but lazily
+    if name == "supabase":
+        return get_supabase()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# 🔹 Async client — created lazily on first use inside the event loop.
+#    It rides on one pooled HTTP/2 connection set that lives for the whole
+#    process, so requests reuse warm TLS sessions to PostgREST instead of
+#    paying a fresh handshake each time (Supabase pools the Postgres side).
+_async_supabase = None
+_async_supabase_lock = asyncio.Lock()
+_async_http = None
+
+
+async def get_async_supabase() -> AsyncClient:
+    """
+    Returns the shared async Supabase client (one per process), so request
+    handlers can `await` PostgREST calls instead of blocking the event loop.
+    """
+    global _async_supabase, _async_http
+    if _async_supabase is None:
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                limits = _pool_limits(SUPABASE_POOL_SIZE)
+                _log_pool("async", limits)
+                _async_http = httpx.AsyncClient(
+                    transport=_OrjsonAsyncTransport(
+                        http2=True, limits=limits, retries=SUPABASE_CONNECT_RETRIES
+                    ),
+                    follow_redirects=True,
+                    timeout=httpx.Timeout(30.0, connect=5.0),
+                )
+                _async_supabase = await acreate_client(
+                    SUPABASE_URL,
+                    SUPABASE_KEY,
+                    options=AsyncClientOptions(httpx_client=_async_http),
+                )
+    return _async_supabase
+
+
+async def warm_async_supabase(timeout: float = 5.0) -> AsyncClient:
+    """
+    Opens the async client and runs one trivial RPC (app startup), so the
+    TLS handshake + HTTP/2 setup to PostgREST happen before the first user
+    request. Best-effort: a slow or failed ping is logged, never raised.
+    """
+    client = await get_async_supabase()
+    try:
+        await asyncio.wait_for(call_rpc_async("ping_noop"), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️ Supabase warm-up ping timed out after %ss", timeout)
+    return client
+
+
+async def close_async_supabase():
+    """Closes the pooled connections behind the async client (app shutdown)."""
+    global _async_supabase, _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+    _async_supabase = None
+    _async_http = None
+    await close_rpc_cache()
+
+
+# ───────────────────────────────────────────────
+# 🔹 Retry — transient pool / pooler failures only
+# ───────────────────────────────────────────────
+SUPABASE_RETRY_ATTEMPTS = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", "3"))
+SUPABASE_RETRY_BASE = float(os.getenv("SUPABASE_RETRY_BASE", "0.1"))
+
+# Failures where the statement never reached Postgres, so retrying a write
+# can't apply it twice. Read timeouts / 504s are deliberately not retried.
+_RETRY_HTTPX = (httpx.PoolTimeout, httpx.ConnectError, httpx.ConnectTimeout)
+_RETRY_PGRST = {"PGRST000", "PGRST001", "PGRST002", "PGRST003"}  # PostgREST ↔ DB connection errors
+_RETRY_STATUS = {502, 503}
+
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, _RETRY_HTTPX):
+        return True
+    if isinstance(e, APIError):
+        # JSON errors carry PostgREST codes; non-JSON gateway errors carry the HTTP status
+        return e.code in _RETRY_PGRST or e.code in _RETRY_STATUS
+    return False
+
+
+def _backoff(attempt: int, base: float) -> float:
+    return random.uniform(0, base * 2 ** attempt)  # full jitter
+
+
+async def with_retry(build, *, attempts: int = None, base: float = None):
+    """
+    Executes `build(client)` (a query / rpc builder) with jittered exponential
+    backoff on transient failures; anything else is raised on the first try.
+    The builder is rebuilt per attempt against the current shared client.
+    """
+    attempts = attempts or SUPABASE_RETRY_ATTEMPTS
+    base = SUPABASE_RETRY_BASE if base is None else base
+    for attempt in range(attempts):
+        try:
+            return await build(await get_async_supabase()).execute()
+        except Exception as e:
+            if attempt == attempts - 1 or not _is_transient(e):
+                raise
+            logger.warning("⚠️ Transient Supabase error (%s), retry %d/%d", e, attempt + 1, attempts - 1)
+            await asyncio.sleep(_backoff(attempt, base))
+
 
 # ───────────────────────────────────────────────
 # 🔹 RPC Helper — Universal Caller
@@ -37,47 +225,335 @@ def call_rpc(function_name: str, params: dict = None):
     """
     try:
         if not function_name:
-            print("⚠️ Missing function name in call_rpc()")
+            logger.warning("⚠️ Missing function name in call_rpc()")
             return None
 
         # 🧩 Default empty params for optional RPCs
         params = params or {}
 
-        # 🧾 Debug logging for traceability (toggle off in production)
-        print(f"🧠 Calling RPC → {function_name} | Params: {params}")
+        # 🧾 Debug logging for traceability (LOG_LEVEL=DEBUG to see it)
+        logger.debug("🧠 Calling RPC → %s | Params: %s", function_name, params)
+
+        res = get_supabase().rpc(function_name, params).execute()
+        return _normalize_rpc_data(function_name, getattr(res, "data", None))
+
+    except Exception as e:
+        logger.error("❌ RPC Exception in %s: %s", function_name, e, exc_info=True)
+        return None
 
-        res = supabase.rpc(function_name, params).execute()
-        data = getattr(res, "data", None)
 
-        # 🔍 Validate and normalize return data
-        if not data:
-            print(f"⚠️ RPC {function_name} returned no data.")
+async def call_rpc_async(function_name: str, params: dict = None):
+    """
+    Async twin of call_rpc() — same params and return shape, but awaits the
+    shared AsyncClient so the calling request handler doesn't block.
+    """
+    try:
+        if not function_name:
+            logger.warning("⚠️ Missing function name in call_rpc_async()")
             return None
 
-        # Handle RPC returning a LIST of objects
-        if isinstance(data, list):
-            if len(data) == 0:
-                print(f"⚠️ RPC {function_name} returned an empty list.")
-                return None
-            # Return the first element only if it’s a single-object response
-            if len(data) == 1:
-                return data[0]
-            # Otherwise, return full list (for table-like responses)
-            return data
+        params = params or {}
+        logger.debug("🧠 Calling RPC → %s | Params: %s", function_name, params)
 
-        # Handle RPC returning a DICT
-        elif isinstance(data, dict):
-            return data
+        res = await with_retry(lambda db: db.rpc(function_name, params))
+        return _normalize_rpc_data(function_name, getattr(res, "data", None))
+
+    except Exception as e:
+        logger.error("❌ RPC Exception in %s: %s", function_name, e, exc_info=True)
+        return None
+
+
+# ───────────────────────────────────────────────
+# 🔹 RPC result cache (Redis) — only for RPCs registered as cacheable reads,
+#    shared by every worker. Disabled when REDIS_URL is not configured.
+# ───────────────────────────────────────────────
+REDIS_URL = os.getenv("REDIS_URL")
+
+_rpc_cache = redis.from_url(REDIS_URL) if REDIS_URL else None
+_CACHE_MISS = object()
 
-        # Handle unexpected return types
-        else:
-            print(f"⚠️ Unexpected RPC result type {type(data)} for {function_name}")
-            return None
 
+def _rpc_cache_key(function_name: str, params: dict) -> str:
+    canonical = orjson.dumps(params or {}, option=orjson.OPT_SORT_KEYS)
+    return f"rpc:{function_name}:{hashlib.blake2b(canonical, digest_size=16).hexdigest()}"
+
+
+async def _rpc_cache_get(key: str):
+    try:
+        hit = await _rpc_cache.get(key)
+        return _CACHE_MISS if hit is None else orjson.loads(hit)
+    except Exception as e:
+        logger.warning("⚠️ RPC cache read failed: %s", e)
+        return _CACHE_MISS
+
+
+async def _rpc_cache_set(key: str, value, ttl: int):
+    try:
+        await _rpc_cache.set(key, orjson.dumps(value), ex=ttl)
     except Exception as e:
-        print(f"❌ RPC Exception in {function_name}: {e}")
+        logger.warning("⚠️ RPC cache write failed: %s", e)
+
+
+async def close_rpc_cache():
+    if _rpc_cache is not None:
+        await _rpc_cache.aclose()
+
+
+# In-flight reads by key: concurrent identical reads share one call
+_inflight = {}
+
+
+async def _singleflight(key, make_coro):
+    """
+    Runs make_coro() once per key at a time; callers arriving while it is in
+    flight await the same result (shared object — treat as read-only).
+    Only for pure reads. A cancelled caller doesn't cancel the shared call.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(make_coro())
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+# ───────────────────────────────────────────────
+# 🔹 Registered RPCs — return shape fixed at registration
+# ───────────────────────────────────────────────
+_RPC_UNPACK = {
+    "scalar": lambda data: data,                     # RETURNS jsonb / int / ...
+    "row": lambda data: data[0] if data else None,   # RETURNS TABLE / setof, one row
+    "rows": lambda data: data or None,               # RETURNS TABLE / setof, many rows
+}
+
+
+def register_rpc(function_name: str, shape: str = "scalar", cacheable: bool = False, ttl: int = 10):
+    """
+    Returns an async caller `rpc(params)` for one RPC whose return shape is
+    known up front ("scalar" | "row" | "rows"), so each call skips
+    _normalize_rpc_data()'s type/length sniffing ("auto" keeps it, for RPCs
+    of unknown shape). Same failure contract as call_rpc_async(): errors are
+    logged and come back as None.
+
+    cacheable=True is only for pure reads: concurrent identical calls are
+    coalesced into one, and results are kept in Redis (when configured) for
+    `ttl` seconds keyed on (function_name, params). None is never cached.
+    """
+    if shape == "auto":
+        unpack = partial(_normalize_rpc_data, function_name)
+    else:
+        unpack = _RPC_UNPACK[shape]
+
+    async def call(params: dict = None):
+        try:
+            logger.debug("🧠 Calling RPC → %s | Params: %s", function_name, params)
+            res = await with_retry(lambda db: db.rpc(function_name, params or {}))
+            return unpack(res.data)
+        except Exception as e:
+            logger.error("❌ RPC Exception in %s: %s", function_name, e, exc_info=True)
+            return None
+
+    async def cached_call(params, key):
+        if _rpc_cache is not None:
+            hit = await _rpc_cache_get(key)
+            if hit is not _CACHE_MISS:
+                return hit
+        result = await call(params)
+        if result is not None and _rpc_cache is not None:
+            await _rpc_cache_set(key, result, ttl)
+        return result
+
+    if not cacheable:
+        rpc = call
+    else:
+        async def rpc(params: dict = None):
+            key = _rpc_cache_key(function_name, params)
+            return await _singleflight(key, lambda: cached_call(params, key))
+
+    rpc.__name__ = rpc.__qualname__ = function_name
+    return rpc
+
+
+def _normalize_rpc_data(function_name: str, data):
+    """Normalizes RPC `data` → dict, list (table-like) or None."""
+    # Decoded JSON is always a plain list / dict, so exact type checks suffice
+    kind = type(data)
+
+    # RETURNS TABLE / setof → a list: one row unwraps, several stay a list
+    if kind is list:
+        if len(data) == 1:
+            return data[0]
+        if data:
+            return data
+
+    # RETURNS jsonb → a dict
+    elif kind is dict:
+        if data:
+            return data
+
+    # Handle unexpected return types
+    elif data:
+        logger.warning("⚠️ Unexpected RPC result type %s for %s", kind, function_name)
         return None
 
+    logger.debug("⚠️ RPC %s returned no data.", function_name)
+    return None
+
+
+# ───────────────────────────────────────────────
+# 🔹 Write Batcher — many small writes, one RPC round trip
+#    Items submitted within `max_wait` seconds (up to `max_batch` of them)
+#    are sent to `rpc_name` as one jsonb array. submit() awaits the outcome
+#    of the batch its item went out in; enqueue() is fire-and-forget.
+#    A failed batch is retried `flush_attempts` times, then its rows are
+#    pushed to the `dead_letter` Redis list (or logged, without Redis).
+#    With `key` set, drain(key) waits only for that key's pending writes.
+#    At most `max_inflight` batches are flushed at once; past that the drain
+#    loop waits, the queue fills, and enqueue() pushes back on the caller.
+# ───────────────────────────────────────────────
+class WriteBatcher:
+    def __init__(self, rpc_name: str, param_name: str, max_batch: int = 8, max_wait: float = 0.02,
+                 max_queue: int = 10_000, key=None, max_inflight: int = 4,
+                 flush_attempts: int = 3, retry_base: float = 0.5, dead_letter: str = None):
+        self.rpc_name = rpc_name
+        self.param_name = param_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.key = key
+        self.max_inflight = max_inflight
+        self.flush_attempts = flush_attempts
+        self.retry_base = retry_base
+        self.dead_letter = dead_letter
+        self._rpc = register_rpc(rpc_name)
+        self._queue = None
+        self._task = None
+        self._flushes = set()  # held so in-flight flush tasks aren't garbage-collected
+        self._slots = None
+        self._pending = {}  # key → [unflushed count, Event set when it reaches 0]
+
+    def start(self):
+        """Starts the drain loop — call inside the running event loop (app lifespan)."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._slots = asyncio.Semaphore(self.max_inflight)
+            self._task = asyncio.create_task(self._drain())
+
+    async def submit(self, item: dict) -> bool:
+        """Queues one write and waits for its batch. True if the RPC succeeded."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._put(item, future)
+        return await future
+
+    async def enqueue(self, item: dict):
+        """Queues one write without waiting for it; only blocks while the queue is full."""
+        self.start()
+        await self._put(item, None)
+
+    async def drain(self, key=None):
+        """
+        Waits until every write queued so far has been flushed — or, given a
+        `key`, only the pending writes for that key.
+        """
+        if self._task is None:
+            return
+        if key is None:
+            await self._queue.join()
+            return
+        pending = self._pending.get(key)
+        if pending is not None:
+            await pending[1].wait()
+
+    async def _put(self, item: dict, future):
+        if self.key is not None:
+            pending = self._pending.get(self.key(item))
+            if pending is None:
+                pending = self._pending[self.key(item)] = [0, asyncio.Event()]
+            pending[0] += 1
+        try:
+            await self._queue.put((item, future))
+        except BaseException:
+            self._done(item)  # cancelled while the queue was full
+            raise
+
+    def _done(self, item: dict):
+        if self.key is None:
+            return
+        k = self.key(item)
+        pending = self._pending[k]
+        pending[0] -= 1
+        if pending[0] == 0:
+            pending[1].set()
+            del self._pending[k]
+
+    async def close(self):
+        """Flushes everything already queued, then stops the drain loop (app shutdown)."""
+        if self._task is None:
+            return
+        await self.drain()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Flush without blocking the next batch from filling up
+            await self._slots.acquire()
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._flushes.discard(task)
+        self._slots.release()
+
+    async def _flush(self, batch: list):
+        rows = [item for item, _ in batch]
+        ok = False
+        for attempt in range(self.flush_attempts):
+            if await self._rpc({self.param_name: rows}) is not None:
+                ok = True
+                break
+            logger.warning("⚠️ Batched write %s failed for %d item(s), attempt %d/%d",
+                           self.rpc_name, len(rows), attempt + 1, self.flush_attempts)
+            if attempt < self.flush_attempts - 1:
+                await asyncio.sleep(_backoff(attempt, self.retry_base))
+        if not ok:
+            await self._dead_letter(rows)
+        for item, future in batch:
+            if future is not None and not future.done():
+                future.set_result(ok)
+            self._done(item)
+            self._queue.task_done()
+
+    async def _dead_letter(self, rows: list):
+        """Parks the rows of a batch that kept failing, so they can be replayed."""
+        if self.dead_letter and _rpc_cache is not None:
+            try:
+                await _rpc_cache.rpush(self.dead_letter, *(orjson.dumps(row) for row in rows))
+                logger.error("💀 Batched write %s gave up on %d item(s) → Redis list %s",
+                             self.rpc_name, len(rows), self.dead_letter)
+                return
+            except Exception as e:
+                logger.warning("⚠️ Dead-letter push to %s failed: %s", self.dead_letter, e)
+        # No Redis: the log line is the dead-letter record
+        logger.error("💀 Batched write %s gave up on %d item(s): %s",
+                     self.rpc_name, len(rows), orjson.dumps(rows).decode())
+
 
 # ───────────────────────────────────────────────
 # 🔹 Utility Helper — Direct Table Access (Optional)
@@ -89,7 +565,7 @@ def fetch_latest_pointer(student_id: str, chapter_id: str):
     """
     try:
         res = (
-            supabase.table("student_phase_pointer")
+            get_supabase().table("student_phase_pointer")
             .select("pointer_id, conversation_log, updated_at")
             .eq("student_id", student_id)
             .eq("chapter_id", chapter_id)
@@ -100,10 +576,10 @@ def fetch_latest_pointer(student_id: str, chapter_id: str):
         if res.data and len(res.data) > 0:
             return res.data[0]
         else:
-            print(f"⚠️ No pointer found for student {student_id}, chapter {chapter_id}")
+            logger.debug("⚠️ No pointer found for student %s, chapter %s", student_id, chapter_id)
             return None
     except Exception as e:
-        print(f"⚠️ Error fetching latest pointer: {e}")
+        logger.warning("⚠️ Error fetching latest pointer: %s", e, exc_info=True)
         return None
 
 
@@ -115,19 +591,18 @@ def log_bookmark_action(student_id: str, chapter_id: str, pointer_id: int, is_bo
     Logs bookmark toggle action into 'student_phase_pointer' with updated timestamp.
     """
     try:
-        supabase.table("student_phase_pointer") \
-            .update({
-                "is_bookmarked": is_bookmarked,
-                "bookmark_updated_time": datetime.utcnow().isoformat() + "Z",
-                "updated_at": datetime.utcnow().isoformat() + "Z",
-            }) \
+        # bookmark_updated_time is stamped by the touch_phase_pointer trigger; updated_at
+        # is left alone so bookmarking an older card doesn't make it the "latest" pointer
+        get_supabase().table("student_phase_pointer") \
+            .update({"is_bookmarked": is_bookmarked}) \
             .eq("student_id", student_id) \
             .eq("chapter_id", chapter_id) \
             .eq("pointer_id", pointer_id) \
             .execute()
-        print(f"🔖 Bookmark updated → Student: {student_id}, Chapter: {chapter_id}, Pointer: {pointer_id}, State: {is_bookmarked}")
+        logger.debug("🔖 Bookmark updated → Student: %s, Chapter: %s, Pointer: %s, State: %s",
+                    student_id, chapter_id, pointer_id, is_bookmarked)
     except Exception as e:
-        print(f"⚠️ Failed to update bookmark: {e}")
+        logger.warning("⚠️ Failed to update bookmark: %s", e, exc_info=True)
 
 
 # ───────────────────────────────────────────────
@@ -148,16 +623,15 @@ def save_mcq_submission(student_id: str, chapter_id: str, react_order: int,
             "correct_answer": correct_answer,
             "is_correct": is_correct,
             "is_completed": is_completed,
-            "submitted_at": datetime.utcnow().isoformat() + "Z",
-        }
+        }  # submitted_at: column default / touch_mcq_submission trigger
 
-        supabase.table("student_mcq_submissions") \
+        get_supabase().table("student_mcq_submissions") \
             .upsert(payload, on_conflict=["student_id", "chapter_id", "react_order"]) \
             .execute()
 
-        print(f"✅ MCQ saved → student {student_id}, chapter {chapter_id}, react_order {react_order}")
+        logger.debug("✅ MCQ saved → student %s, chapter %s, react_order %s", student_id, chapter_id, react_order)
         return True
 
     except Exception as e:
-        print(f"❌ Failed to save MCQ submission: {e}")
+        logger.error("❌ Failed to save MCQ submission: %s", e, exc_info=True)
         return False
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The app modules are top-level files in the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# gpt_utils builds its OpenAI client at import time; no request is ever sent
+os.environ.setdefault("OPENAI_API_KEY", "test")
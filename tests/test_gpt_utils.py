@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import gpt_utils
+
+
+class _WordEncoding:
+    """Stand-in for the tiktoken encoding: one token per whitespace-separated word."""
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+
+def _log(n, words=10):
+    return [
+        {"role": "student" if i % 2 == 0 else "mentor", "content": " ".join([f"t{i}"] * words), "ts": "x"}
+        for i in range(n)
+    ]
+
+
+def _tokens(messages):
+    return sum(gpt_utils._count_tokens(m["content"]) for m in messages)
+
+
+@pytest.fixture
+def tokenizer(monkeypatch):
+    monkeypatch.setattr(gpt_utils, "_encoding", _WordEncoding())
+
+
+def test_turn_cap(monkeypatch):
+    monkeypatch.setattr(gpt_utils, "_encoding", None)
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TURNS", 12)
+
+    messages = gpt_utils._build_history_messages("prompt", _log(50))
+
+    assert messages[0]["role"] == "system"
+    assert len(messages) == 1 + 12
+    assert messages[-1]["content"].startswith("t49 ")
+    assert all(set(m) == {"role", "content"} for m in messages)
+
+
+def test_token_cap(tokenizer, monkeypatch):
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TURNS", 10_000)
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TOKENS", 500)
+
+    messages = gpt_utils._build_history_messages("prompt", _log(1000))
+
+    assert _tokens(messages) <= 500
+    assert 1 < len(messages) < 1000
+    # The newest turns are the ones kept, in order
+    assert messages[-1]["content"].startswith("t999 ")
+    assert messages[-2]["content"].startswith("t998 ")
+
+
+def test_latest_turn_always_kept(tokenizer, monkeypatch):
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TOKENS", 50)
+    log = _log(5) + [{"role": "student", "content": "long " * 200}]
+
+    messages = gpt_utils._build_history_messages("prompt", log)
+
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert messages[-1]["content"] == log[-1]["content"]
+
+
+def test_turn_count_fallback_without_tokenizer(monkeypatch):
+    monkeypatch.setattr(gpt_utils, "_encoding", None)
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TURNS", 12)
+    monkeypatch.setattr(gpt_utils, "GPT_CONTEXT_TOKENS", 1)
+
+    messages = gpt_utils._build_history_messages("prompt", _log(20, words=100))
+
+    # Token budget is ignored until warm_tokenizer() has loaded the encoding
+    assert len(messages) == 1 + 12
+
+
+def test_warm_tokenizer_failure_leaves_turn_windowing(monkeypatch):
+    def broken():
+        raise OSError("no network")
+
+    monkeypatch.setattr(gpt_utils, "_encoding", None)
+    monkeypatch.setattr(gpt_utils, "_load_encoding", broken)
+    asyncio.run(gpt_utils.warm_tokenizer(timeout=1.0))
+
+    assert gpt_utils._encoding is None
+    assert len(gpt_utils._build_history_messages("prompt", _log(30))) == 1 + gpt_utils.GPT_CONTEXT_TURNS
@@ -0,0 +1,7 @@
+# time_utils.py
+from datetime import datetime, timezone
+
+
+def utc_now_iso() -> str:
+    """UTC timestamp as ISO-8601 with a trailing Z, millisecond precision."""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")